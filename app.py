@@ -9,49 +9,767 @@ from flask import (
     session,
 )
 import requests
-from functools import wraps
+from functools import partial, wraps
 import time
 import json
+import hashlib
+import gzip
 import aiohttp
 import asyncio
-from collections import defaultdict
+from collections import defaultdict, deque
+import heapq
+import random
+import re
 from operator import itemgetter
 import logging
 from flask_cors import CORS
 import os
 import sqlite3
+import queue
+from contextlib import contextmanager
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import uuid
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 import atexit
+import sys
 import threading
+import cProfile
+import pstats
+import mmap
 from apscheduler.events import EVENT_JOB_EXECUTED, EVENT_JOB_ERROR
+import history_store
+import auction_decoder
+
+try:
+    import orjson
+except ImportError:  # optional, falls back to the stdlib encoder
+    orjson = None
+try:
+    import brotli
+except ImportError:  # optional, responses are then only gzipped
+    brotli = None
+try:
+    import fcntl
+except ImportError:  # no file locks (Windows); every process ingests
+    fcntl = None
+try:
+    import numpy as np
+except ImportError:  # optional, /rank then evaluates row by row
+    np = None
 
 init_event = threading.Event()
+last_update_time = None
+
+DB_PATH = "pet_prices.db"
+READ_POOL_SIZE = 8
+
+# Raw 5-minute rows are kept for RAW_RETENTION_DAYS, then rolled up into
+# hourly buckets, which are rolled into daily buckets after
+# HOURLY_RETENTION_DAYS. Raw retention never goes below the 7 day window the
+# summary averages are computed over.
+RAW_RETENTION_DAYS = 7
+HOURLY_RETENTION_DAYS = 90
+
+# Where raw rows live: "sqlite" keeps them in the pet_prices table, "columnar"
+# appends them to the memory-mapped day files of history_store instead, and
+# "intervals" keeps one pet_listings row per listing that is extended while the
+# same uuid stays the cheapest. The summary and rollup tables stay in SQLite
+# either way.
+HISTORY_BACKEND = os.environ.get("PETCALC_HISTORY_BACKEND", "sqlite")
+
+# A listing interval covers (covered_from, last_seen]: each sighting stands for
+# the time since the series' previous one, at most LISTING_GAP_SECONDS, or
+# LISTING_SPAN_SECONDS (one update cycle) for a series seen for the first
+# time. A listing that goes unseen for longer than LISTING_GAP_SECONDS starts
+# a new interval when it returns.
+LISTING_SPAN_SECONDS = 300
+LISTING_GAP_SECONDS = 900
+
+# One long-lived writer connection shared by ingestion, guarded by a lock, and
+# a small pool of read-only connections handed out to request handlers.
+_writer_conn = None
+_writer_lock = threading.Lock()
+_read_pool = queue.Queue(maxsize=READ_POOL_SIZE)
+
+
+def connect_db(read_only=False):
+    if read_only:
+        conn = sqlite3.connect(
+            f"file:{DB_PATH}?mode=ro", uri=True, check_same_thread=False
+        )
+    else:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+def get_writer_connection():
+    global _writer_conn
+    if _writer_conn is None:
+        _writer_conn = connect_db()
+    return _writer_conn
+
+
+@contextmanager
+def db_writer():
+    """Yield the writer connection inside a transaction."""
+    conn = get_writer_connection()
+    with _writer_lock, conn:
+        yield conn
+
+
+@contextmanager
+def db_reader():
+    """Borrow a read-only connection from the pool."""
+    try:
+        conn = _read_pool.get_nowait()
+    except queue.Empty:
+        conn = connect_db(read_only=True)
+    try:
+        yield conn
+    finally:
+        try:
+            _read_pool.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
 
 # Initialize the database
 def init_db():
-    conn = sqlite3.connect("pet_prices.db")
-    c = conn.cursor()
-    c.execute(
-        """CREATE TABLE IF NOT EXISTS pet_prices
+    with db_writer() as conn:
+        # Every worker of a multi-process server runs this at import; take
+        # the write lock up front so only one of them migrates at a time
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS pet_prices
                  (pet_name TEXT, rarity TEXT, level TEXT, price INTEGER, timestamp DATETIME, uuid TEXT)"""
-    )
-    c.execute(
-        """CREATE INDEX IF NOT EXISTS idx_pet_prices ON pet_prices 
+        )
+        conn.execute(
+            """CREATE INDEX IF NOT EXISTS idx_pet_prices ON pet_prices 
                  (pet_name, rarity, level, timestamp)"""
+        )
+        conn.execute(
+            """CREATE INDEX IF NOT EXISTS idx_pet_prices_timestamp ON pet_prices
+                 (timestamp)"""
+        )
+        # Latest price plus running day/week sums per pet, kept up to date on
+        # every write so reads never have to scan the history.
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS pet_price_summary
+                 (pet_name TEXT, rarity TEXT, level TEXT, price INTEGER, uuid TEXT, timestamp DATETIME,
+                  day_sum INTEGER, day_count INTEGER, week_sum INTEGER, week_count INTEGER,
+                  PRIMARY KEY (pet_name, rarity, level))"""
+        )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS pet_price_meta
+                 (key TEXT PRIMARY KEY, value TEXT)"""
+        )
+        for table in ("pet_prices_hourly", "pet_prices_daily"):
+            conn.execute(
+                f"""CREATE TABLE IF NOT EXISTS {table}
+                 (pet_name TEXT, rarity TEXT, level TEXT, bucket DATETIME,
+                  open_price INTEGER, high_price INTEGER, low_price INTEGER, close_price INTEGER,
+                  price_sum INTEGER, count INTEGER,
+                  PRIMARY KEY (pet_name, rarity, level, bucket))"""
+            )
+        conn.execute(
+            """CREATE TABLE IF NOT EXISTS pet_listings
+                 (pet_name TEXT, rarity TEXT, level TEXT, uuid TEXT, price INTEGER,
+                  covered_from DATETIME, first_seen DATETIME, last_seen DATETIME)"""
+        )
+        conn.execute(
+            """CREATE INDEX IF NOT EXISTS idx_pet_listings ON pet_listings
+                 (pet_name, rarity, level, last_seen)"""
+        )
+        conn.execute(
+            """CREATE INDEX IF NOT EXISTS idx_pet_listings_last_seen ON pet_listings
+                 (last_seen)"""
+        )
+        # Tables created before covered_from existed covered one update cycle
+        # before first_seen, so backfill that
+        listing_columns = [row[1] for row in conn.execute("PRAGMA table_info(pet_listings)")]
+        if "covered_from" not in listing_columns:
+            conn.execute("ALTER TABLE pet_listings ADD COLUMN covered_from DATETIME")
+            conn.execute(
+                f"""UPDATE pet_listings
+                   SET covered_from = datetime(first_seen, '-{LISTING_SPAN_SECONDS} seconds')"""
+            )
+            conn.execute("DROP INDEX IF EXISTS idx_pet_listings_first_seen")
+        conn.execute(
+            """CREATE INDEX IF NOT EXISTS idx_pet_listings_covered_from ON pet_listings
+                 (covered_from)"""
+        )
+        if HISTORY_BACKEND == "columnar" and not history_store.stored_days():
+            move_pet_prices_to_history_store(conn)
+        if (
+            HISTORY_BACKEND == "intervals"
+            and conn.execute("SELECT 1 FROM pet_listings LIMIT 1").fetchone() is None
+        ):
+            move_pet_prices_to_listings(conn)
+        # The interval summary sums seconds rather than rows, so switching to
+        # or from it needs a rebuild. Summaries from before that count rows.
+        if (
+            get_db_meta(conn, "summary_day_cutoff") is None
+            or (get_db_meta(conn, "summary_weights") or "rows") != summary_weights()
+        ):
+            rebuild_price_summary(conn, datetime.now())
+
+
+def move_pet_prices_to_history_store(conn):
+    """Move raw rows from pet_prices into the columnar store, oldest first."""
+    cursor = conn.execute(
+        "SELECT pet_name, rarity, level, price, timestamp, uuid FROM pet_prices ORDER BY timestamp"
+    )
+    moved = 0
+    while True:
+        batch = cursor.fetchmany(100_000)
+        if not batch:
+            break
+        history_store.append_rows(
+            [
+                (pet, rarity, level, price, datetime.fromisoformat(timestamp), uuid)
+                for pet, rarity, level, price, timestamp, uuid in batch
+            ]
+        )
+        moved += len(batch)
+    if moved:
+        conn.execute("DELETE FROM pet_prices")
+        logging.info(f"Moved {moved} rows from pet_prices into the columnar history store")
+
+
+def listing_seconds(earlier, later):
+    """Whole epoch seconds between two sightings, as listing_window_sums counts them."""
+    return max(0, int((later.replace(microsecond=0) - earlier.replace(microsecond=0)).total_seconds()))
+
+
+def new_listing_interval(pet, rarity, level, uuid, price, timestamp, previous_sighting):
+    """Open an interval, covering back to the series' previous sighting if any.
+
+    Returns the interval row and the seconds it covers.
+    """
+    seconds = LISTING_SPAN_SECONDS
+    if previous_sighting is not None:
+        seconds = min(listing_seconds(previous_sighting, timestamp), LISTING_GAP_SECONDS)
+    covered_from = timestamp - timedelta(seconds=seconds)
+    return [pet, rarity, level, uuid, price, covered_from, timestamp, timestamp], seconds
+
+
+def fold_listing_rows(rows, current=None):
+    """Fold (pet, rarity, level, price, timestamp, uuid) rows into listing intervals.
+
+    Rows must be sorted by series, then time. ``current`` is the still open
+    [pet, rarity, level, uuid, price, covered_from, first_seen, last_seen]
+    interval of the previous call; returns the closed intervals and the new
+    open one.
+    """
+    intervals = []
+    for pet, rarity, level, price, timestamp, uuid in rows:
+        previous_sighting = None
+        if current is not None and current[:3] == [pet, rarity, level]:
+            previous_sighting = current[7]
+            elapsed = listing_seconds(previous_sighting, timestamp)
+            if current[3:5] == [uuid, price] and 0 < elapsed <= LISTING_GAP_SECONDS:
+                current[7] = timestamp
+                continue
+        if current is not None:
+            intervals.append(tuple(current))
+        current, _ = new_listing_interval(
+            pet, rarity, level, uuid, price, timestamp, previous_sighting
+        )
+    return intervals, current
+
+
+def insert_listing_intervals(conn, intervals):
+    """Insert [pet, rarity, level, uuid, price, covered_from, first_seen, last_seen] rows.
+
+    Columns are named because migrated tables have covered_from last.
+    """
+    conn.executemany(
+        """INSERT INTO pet_listings
+             (pet_name, rarity, level, uuid, price, covered_from, first_seen, last_seen)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        intervals,
+    )
+
+
+def move_pet_prices_to_listings(conn):
+    """Collapse raw rows from pet_prices into pet_listings intervals."""
+    cursor = conn.execute(
+        """SELECT pet_name, rarity, level, price, timestamp, uuid FROM pet_prices
+           ORDER BY pet_name, rarity, level, timestamp"""
     )
-    conn.commit()
-    conn.close()
+    moved = intervals = 0
+    current = None
+    while True:
+        batch = cursor.fetchmany(100_000)
+        if not batch:
+            break
+        closed, current = fold_listing_rows(
+            [
+                (pet, rarity, level, price, datetime.fromisoformat(timestamp), uuid)
+                for pet, rarity, level, price, timestamp, uuid in batch
+            ],
+            current,
+        )
+        insert_listing_intervals(conn, closed)
+        moved += len(batch)
+        intervals += len(closed)
+    if current is not None:
+        insert_listing_intervals(conn, [current])
+        intervals += 1
+    if moved:
+        conn.execute("DELETE FROM pet_prices")
+        logging.info(f"Collapsed {moved} rows from pet_prices into {intervals} listing intervals")
 
 
 def reset_db():
-    conn = sqlite3.connect("pet_prices.db")
-    c = conn.cursor()
-    c.execute("DROP TABLE IF EXISTS pet_prices")
-    conn.commit()
-    conn.close()
+    with db_writer() as conn:
+        conn.execute("DROP TABLE IF EXISTS pet_prices")
+        conn.execute("DROP TABLE IF EXISTS pet_listings")
+        conn.execute("DROP TABLE IF EXISTS pet_price_summary")
+        conn.execute("DROP TABLE IF EXISTS pet_price_meta")
+        conn.execute("DROP TABLE IF EXISTS pet_prices_hourly")
+        conn.execute("DROP TABLE IF EXISTS pet_prices_daily")
+    history_store.clear()
     init_db()
 
+
+def get_db_meta(conn, key):
+    row = conn.execute("SELECT value FROM pet_price_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def set_db_meta(conn, key, value):
+    conn.execute(
+        "INSERT OR REPLACE INTO pet_price_meta (key, value) VALUES (?, ?)", (key, value)
+    )
+
+
+def summary_weights():
+    """What the summary counts measure: raw rows, or seconds of listing time."""
+    return "seconds" if HISTORY_BACKEND == "intervals" else "rows"
+
+
+def listing_window_sums(conn, start, end):
+    """Return {(pet_name, rarity, level): (seconds, price_seconds)} for start < time <= end.
+
+    Seconds are whole epoch seconds, so the slices of one interval cut at
+    successive window bounds add up to exactly what was added for it.
+    """
+    return {
+        (pet, rarity, level): (seconds, total)
+        for pet, rarity, level, seconds, total in conn.execute(
+            """
+        SELECT pet_name, rarity, level, SUM(seconds), SUM(price * seconds)
+        FROM (
+            SELECT pet_name, rarity, level, price,
+                   MIN(CAST(strftime('%s', last_seen) AS INTEGER), CAST(strftime('%s', ?) AS INTEGER))
+                   - MAX(CAST(strftime('%s', covered_from) AS INTEGER),
+                         CAST(strftime('%s', ?) AS INTEGER)) as seconds
+            FROM pet_listings
+            WHERE last_seen > ? AND covered_from < ?
+        )
+        WHERE seconds > 0
+        GROUP BY pet_name, rarity, level
+        """,
+            (end, start, start, end),
+        )
+    }
+
+
+def rebuild_price_summary(conn, now):
+    """Recompute pet_price_summary from the full pet_prices history."""
+    day_cutoff = now - timedelta(days=1)
+    week_cutoff = now - timedelta(days=7)
+    conn.execute("DELETE FROM pet_price_summary")
+    set_db_meta(conn, "summary_weights", summary_weights())
+    if HISTORY_BACKEND in ("columnar", "intervals"):
+        if HISTORY_BACKEND == "columnar":
+            day, week = (
+                {
+                    key: (count, total)
+                    for key, (count, total, _, _) in history_store.window_aggregates(
+                        cutoff, now
+                    ).items()
+                }
+                for cutoff in (day_cutoff, week_cutoff)
+            )
+            latest = {
+                key: (price, "N/A", timestamp)
+                for key, (price, timestamp) in history_store.latest_prices().items()
+            }
+        else:
+            day = listing_window_sums(conn, day_cutoff, now)
+            week = listing_window_sums(conn, week_cutoff, now)
+            latest = {
+                (pet, rarity, level): (price, uuid, last_seen)
+                for pet, rarity, level, price, uuid, last_seen in conn.execute(
+                    """
+                SELECT pet_name, rarity, level, price, uuid, last_seen
+                FROM (
+                    SELECT *, ROW_NUMBER() OVER (
+                        PARTITION BY pet_name, rarity, level ORDER BY last_seen DESC
+                    ) as rn
+                    FROM pet_listings
+                )
+                WHERE rn = 1
+                """
+                )
+            }
+        conn.executemany(
+            "INSERT INTO pet_price_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    *key,
+                    price,
+                    uuid,
+                    timestamp,
+                    day.get(key, (0, 0))[1],
+                    day.get(key, (0, 0))[0],
+                    week.get(key, (0, 0))[1],
+                    week.get(key, (0, 0))[0],
+                )
+                for key, (price, uuid, timestamp) in latest.items()
+            ],
+        )
+        set_db_meta(conn, "summary_day_cutoff", str(day_cutoff))
+        set_db_meta(conn, "summary_week_cutoff", str(week_cutoff))
+        return
+
+    conn.execute(
+        """
+    INSERT INTO pet_price_summary
+    SELECT pet_name, rarity, level, price, uuid, timestamp, 0, 0, 0, 0
+    FROM (
+        SELECT pet_name, rarity, level, price, uuid, timestamp,
+               ROW_NUMBER() OVER (PARTITION BY pet_name, rarity, level ORDER BY timestamp DESC) as rn
+        FROM pet_prices
+    )
+    WHERE rn = 1
+    """
+    )
+    conn.execute(
+        """
+    UPDATE pet_price_summary
+    SET day_sum = w.day_sum, day_count = w.day_count,
+        week_sum = w.week_sum, week_count = w.week_count
+    FROM (
+        SELECT pet_name, rarity, level,
+               SUM(CASE WHEN timestamp > ? THEN price ELSE 0 END) as day_sum,
+               COUNT(CASE WHEN timestamp > ? THEN 1 END) as day_count,
+               SUM(price) as week_sum,
+               COUNT(*) as week_count
+        FROM pet_prices
+        WHERE timestamp > ?
+        GROUP BY pet_name, rarity, level
+    ) AS w
+    WHERE pet_price_summary.pet_name = w.pet_name
+      AND pet_price_summary.rarity = w.rarity
+      AND pet_price_summary.level = w.level
+    """,
+        (day_cutoff, day_cutoff, week_cutoff),
+    )
+    set_db_meta(conn, "summary_day_cutoff", str(day_cutoff))
+    set_db_meta(conn, "summary_week_cutoff", str(week_cutoff))
+
+
+def update_price_summary(conn, rows, snapshot_time, weights=None):
+    """Fold a freshly inserted batch into pet_price_summary.
+
+    Rows that slid out of the day/week windows since the previous cycle are
+    subtracted first, then the new prices are added and become the latest.
+    ``weights`` is what each row adds to the counts, one by default.
+    """
+    for window, days in (("day", 1), ("week", 7)):
+        cutoff = snapshot_time - timedelta(days=days)
+        previous_cutoff = get_db_meta(conn, f"summary_{window}_cutoff")
+        if HISTORY_BACKEND in ("columnar", "intervals"):
+            if HISTORY_BACKEND == "columnar":
+                expired = {
+                    key: (count, total)
+                    for key, (count, total, _, _) in history_store.window_aggregates(
+                        datetime.fromisoformat(previous_cutoff), cutoff
+                    ).items()
+                }
+            else:
+                expired = listing_window_sums(conn, previous_cutoff, cutoff)
+            conn.executemany(
+                f"""
+            UPDATE pet_price_summary
+            SET {window}_sum = {window}_sum - ?, {window}_count = {window}_count - ?
+            WHERE pet_name = ? AND rarity = ? AND level = ?
+            """,
+                [(total, count, *key) for key, (count, total) in expired.items()],
+            )
+            set_db_meta(conn, f"summary_{window}_cutoff", str(cutoff))
+            continue
+        conn.execute(
+            f"""
+        UPDATE pet_price_summary
+        SET {window}_sum = {window}_sum - expired.total,
+            {window}_count = {window}_count - expired.n
+        FROM (
+            SELECT pet_name, rarity, level, SUM(price) as total, COUNT(*) as n
+            FROM pet_prices
+            WHERE timestamp > ? AND timestamp <= ?
+            GROUP BY pet_name, rarity, level
+        ) AS expired
+        WHERE pet_price_summary.pet_name = expired.pet_name
+          AND pet_price_summary.rarity = expired.rarity
+          AND pet_price_summary.level = expired.level
+        """,
+            (previous_cutoff, cutoff),
+        )
+        set_db_meta(conn, f"summary_{window}_cutoff", str(cutoff))
+
+    if weights is None:
+        weights = [1] * len(rows)
+    conn.executemany(
+        """
+    INSERT INTO pet_price_summary VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (pet_name, rarity, level) DO UPDATE SET
+        price = excluded.price,
+        uuid = excluded.uuid,
+        timestamp = excluded.timestamp,
+        day_sum = day_sum + excluded.day_sum,
+        day_count = day_count + excluded.day_count,
+        week_sum = week_sum + excluded.week_sum,
+        week_count = week_count + excluded.week_count
+    """,
+        [
+            (pet, rarity, level, price, uuid, timestamp, price * weight, weight, price * weight, weight)
+            for (pet, rarity, level, price, timestamp, uuid), weight in zip(rows, weights)
+        ],
+    )
+
+
+def write_listing_intervals(conn, rows):
+    """Extend the interval of each row's listing, or open a new one.
+
+    A row extends its series' latest interval when the summary shows the same
+    uuid at the same price, seen at most LISTING_GAP_SECONDS ago. Returns the
+    seconds of listing time each row adds, which is the time since the
+    series' previous sighting either way.
+    """
+    latest = {
+        (pet, rarity, level): (price, uuid, timestamp)
+        for pet, rarity, level, price, uuid, timestamp in conn.execute(
+            "SELECT pet_name, rarity, level, price, uuid, timestamp FROM pet_price_summary"
+        )
+    }
+    extended, opened, weights = [], [], []
+    for pet, rarity, level, price, timestamp, uuid in rows:
+        previous = latest.get((pet, rarity, level))
+        previous_sighting = None
+        if previous is not None:
+            previous_sighting = datetime.fromisoformat(previous[2])
+            elapsed = listing_seconds(previous_sighting, timestamp)
+            if previous[:2] == (price, uuid) and 0 < elapsed <= LISTING_GAP_SECONDS:
+                extended.append((timestamp, pet, rarity, level, uuid, previous[2]))
+                weights.append(elapsed)
+                continue
+        interval, seconds = new_listing_interval(
+            pet, rarity, level, uuid, price, timestamp, previous_sighting
+        )
+        opened.append(interval)
+        weights.append(seconds)
+    conn.executemany(
+        """UPDATE pet_listings SET last_seen = ?
+           WHERE pet_name = ? AND rarity = ? AND level = ? AND uuid = ? AND last_seen = ?""",
+        extended,
+    )
+    insert_listing_intervals(conn, opened)
+    inc_counter("petcalc_listing_intervals_opened_total", len(opened))
+    return weights
+
+
+def write_pet_prices(rows, snapshot_time):
+    """Insert a batch of (pet, rarity, level, price, timestamp, uuid) rows."""
+    weights = None
+    with db_writer() as conn:
+        if HISTORY_BACKEND == "columnar":
+            history_store.append_rows(rows)
+        elif HISTORY_BACKEND == "intervals":
+            weights = write_listing_intervals(conn, rows)
+        else:
+            conn.executemany("INSERT INTO pet_prices VALUES (?, ?, ?, ?, ?, ?)", rows)
+        update_price_summary(conn, rows, snapshot_time, weights)
+    inc_counter("petcalc_rows_written_total", len(rows))
+
+
+def roll_up_prices(conn, source, target, bucket_format, cutoff, time_column, sum_column, count_column):
+    """Fold rows of ``source`` older than ``cutoff`` into OHLC buckets in ``target``.
+
+    ``source`` is either the raw table (one price per row) or a rollup table;
+    the column arguments say where its time, price sum and count live.
+    """
+    if source == "pet_prices":
+        open_col = high_col = low_col = close_col = "price"
+    else:
+        open_col, high_col, low_col, close_col = (
+            "open_price",
+            "high_price",
+            "low_price",
+            "close_price",
+        )
+
+    conn.execute(
+        f"""
+    INSERT INTO {target}
+    SELECT pet_name, rarity, level, rollup_bucket,
+           MAX(CASE WHEN first_rn = 1 THEN {open_col} END),
+           MAX({high_col}),
+           MIN({low_col}),
+           MAX(CASE WHEN last_rn = 1 THEN {close_col} END),
+           SUM({sum_column}),
+           SUM({count_column})
+    FROM (
+        SELECT *, strftime('{bucket_format}', {time_column}) as rollup_bucket,
+               ROW_NUMBER() OVER (
+                   PARTITION BY pet_name, rarity, level, strftime('{bucket_format}', {time_column})
+                   ORDER BY {time_column}
+               ) as first_rn,
+               ROW_NUMBER() OVER (
+                   PARTITION BY pet_name, rarity, level, strftime('{bucket_format}', {time_column})
+                   ORDER BY {time_column} DESC
+               ) as last_rn
+        FROM {source}
+        WHERE {time_column} < ?
+    )
+    GROUP BY pet_name, rarity, level, rollup_bucket
+    ON CONFLICT (pet_name, rarity, level, bucket) DO UPDATE SET
+        high_price = MAX(high_price, excluded.high_price),
+        low_price = MIN(low_price, excluded.low_price),
+        close_price = excluded.close_price,
+        price_sum = price_sum + excluded.price_sum,
+        count = count + excluded.count
+    """,
+        (cutoff,),
+    )
+    return conn.execute(f"DELETE FROM {source} WHERE {time_column} < ?", (cutoff,)).rowcount
+
+
+def listing_points(covered_from, last_seen):
+    """Timestamps of the update cycles a listing interval stands for, oldest first.
+
+    With regular cycles these are the sightings the interval replaced.
+    """
+    cycles = max(1, round((last_seen - covered_from).total_seconds() / LISTING_SPAN_SECONDS))
+    return [
+        last_seen - timedelta(seconds=LISTING_SPAN_SECONDS * k)
+        for k in range(cycles - 1, -1, -1)
+    ]
+
+
+def roll_up_listings(conn, cutoff):
+    """Fold listing intervals that ended before ``cutoff`` into pet_prices_hourly.
+
+    A series' intervals never overlap, so the ones ending before the cutoff
+    are its oldest and buckets are still filled in time order.
+    """
+    buckets = {}
+    for pet, rarity, level, price, covered_from, last_seen in conn.execute(
+        """SELECT pet_name, rarity, level, price, covered_from, last_seen FROM pet_listings
+           WHERE last_seen < ? ORDER BY first_seen""",
+        (cutoff,),
+    ):
+        for timestamp in listing_points(
+            datetime.fromisoformat(covered_from), datetime.fromisoformat(last_seen)
+        ):
+            key = (pet, rarity, level, timestamp.strftime("%Y-%m-%d %H:00:00"))
+            bucket = buckets.get(key)
+            if bucket is None:
+                buckets[key] = [price, price, price, price, price, 1]
+            else:
+                bucket[1] = max(bucket[1], price)
+                bucket[2] = min(bucket[2], price)
+                bucket[3] = price
+                bucket[4] += price
+                bucket[5] += 1
+    conn.executemany(
+        """
+    INSERT INTO pet_prices_hourly VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (pet_name, rarity, level, bucket) DO UPDATE SET
+        high_price = MAX(high_price, excluded.high_price),
+        low_price = MIN(low_price, excluded.low_price),
+        close_price = excluded.close_price,
+        price_sum = price_sum + excluded.price_sum,
+        count = count + excluded.count
+    """,
+        [(*key, *bucket) for key, bucket in buckets.items()],
+    )
+    return conn.execute("DELETE FROM pet_listings WHERE last_seen < ?", (cutoff,)).rowcount
+
+
+def compact_history(now=None):
+    """Roll old raw rows into hourly buckets and old hourly buckets into days.
+
+    Raw rows are never rolled up past the week cutoff of the last cycle:
+    update_price_summary subtracts them from the week sums only once they
+    fall behind it, so anything deleted earlier would stay counted.
+    """
+    now = now or datetime.now()
+    raw_cutoff = (now - timedelta(days=max(RAW_RETENTION_DAYS, 7))).replace(
+        minute=0, second=0, microsecond=0
+    )
+    hourly_cutoff = (now - timedelta(days=HOURLY_RETENTION_DAYS)).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+    compacted_days = []
+    with db_writer() as conn:
+        week_cutoff = get_db_meta(conn, "summary_week_cutoff")
+        if week_cutoff is not None:
+            raw_cutoff = min(raw_cutoff, datetime.fromisoformat(week_cutoff))
+        if HISTORY_BACKEND == "columnar":
+            # Whole day files are rolled up and deleted once the transaction commits
+            compacted_days = history_store.days_before(raw_cutoff)
+            raw_rows = 0
+            for day in compacted_days:
+                buckets = history_store.hourly_buckets(day)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO pet_prices_hourly VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    buckets,
+                )
+                raw_rows += sum(bucket[-1] for bucket in buckets)
+        elif HISTORY_BACKEND == "intervals":
+            raw_rows = roll_up_listings(conn, raw_cutoff)
+        else:
+            raw_rows = roll_up_prices(
+                conn,
+                "pet_prices",
+                "pet_prices_hourly",
+                "%Y-%m-%d %H:00:00",
+                raw_cutoff,
+                "timestamp",
+                "price",
+                "1",
+            )
+        hourly_rows = roll_up_prices(
+            conn,
+            "pet_prices_hourly",
+            "pet_prices_daily",
+            "%Y-%m-%d 00:00:00",
+            hourly_cutoff,
+            "bucket",
+            "price_sum",
+            "count",
+        )
+    for day in compacted_days:
+        history_store.delete_day(day)
+    with _writer_lock:
+        get_writer_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    logging.info(
+        f"Compacted history: {raw_rows} raw rows into hourly, "
+        f"{hourly_rows} hourly buckets into daily"
+    )
+
+
 def initialize_app():
     global last_update_time
     init_db()
@@ -60,7 +778,7 @@ def initialize_app():
 
 def update_pet_prices_wrapper():
     init_event.wait()
-    update_pet_prices()
+    scheduled_update()
 
 def job_listener(event):
     if event.exception:
@@ -77,7 +795,231 @@ logging.basicConfig(
 )
 
 
+# In-process metrics, rendered in the Prometheus text format on /metrics.
+# Series are keyed by (name, sorted label items). The "fetch" ingestion stage
+# includes the "decode" and "extract" time of its pages.
+METRICS = {
+    "petcalc_ingest_cycles_total": ("counter", "Ingestion cycles by result"),
+    "petcalc_ingest_stage_seconds": ("histogram", "Time spent per ingestion stage"),
+    "petcalc_ingest_last_success_timestamp_seconds": (
+        "gauge",
+        "Unix time of the last successful ingestion cycle",
+    ),
+    "petcalc_fetch_page_seconds": ("histogram", "Network latency per auction page"),
+    "petcalc_fetch_page_decode_seconds": ("histogram", "JSON decode time per auction page"),
+    "petcalc_fetch_page_retries_total": ("counter", "Auction page fetch retries"),
+    "petcalc_auctions_fetched_total": ("counter", "Auctions handed to the page reducer"),
+    "petcalc_rows_written_total": ("counter", "Raw price rows written to history"),
+    "petcalc_listing_intervals_opened_total": (
+        "counter",
+        "Listing intervals started instead of extended",
+    ),
+    "petcalc_listing_intervals": ("gauge", "Rows in the pet_listings interval store"),
+    "petcalc_analyze_cache_requests_total": ("counter", "/analyze cache lookups by result"),
+    "petcalc_db_size_bytes": ("gauge", "Size of the SQLite database including its WAL"),
+    "petcalc_history_store_bytes": ("gauge", "Size of the columnar history store"),
+    "petcalc_sse_subscribers": ("gauge", "Open /events streams"),
+    "petcalc_snipe_alerts_total": ("counter", "Underpriced listings alerted on in snipe mode"),
+    "petcalc_snipe_detection_seconds": (
+        "histogram",
+        "Time from a sniped listing's creation to its alert",
+    ),
+}
+METRIC_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+metric_values = {}
+metric_histograms = {}
+metrics_lock = threading.Lock()
+
+# Set through POST /metrics/profile; each profiled ingestion cycle writes a
+# cProfile dump to PROFILE_DIR. The endpoint is unauthenticated, so one request
+# can ask for at most MAX_PROFILE_CYCLES.
+PROFILE_DIR = "profiles"
+MAX_PROFILE_CYCLES = 5
+profile_cycles_remaining = 0
+loop_profiler = None
+
+
+def metric_key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc_counter(name, amount=1, **labels):
+    key = metric_key(name, labels)
+    with metrics_lock:
+        metric_values[key] = metric_values.get(key, 0) + amount
+
+
+def set_gauge(name, value, **labels):
+    with metrics_lock:
+        metric_values[metric_key(name, labels)] = value
+
+
+def observe(name, value, **labels):
+    key = metric_key(name, labels)
+    with metrics_lock:
+        histogram = metric_histograms.get(key)
+        if histogram is None:
+            histogram = {"buckets": [0] * len(METRIC_BUCKETS), "sum": 0.0, "count": 0}
+            metric_histograms[key] = histogram
+        for i, bound in enumerate(METRIC_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+@contextmanager
+def stage_timer(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("petcalc_ingest_stage_seconds", time.perf_counter() - started, stage=stage)
+
+
+def format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def render_metrics():
+    db_size = sum(
+        os.path.getsize(path)
+        for path in (DB_PATH, f"{DB_PATH}-wal")
+        if os.path.exists(path)
+    )
+    set_gauge("petcalc_db_size_bytes", db_size)
+    if HISTORY_BACKEND == "columnar":
+        set_gauge("petcalc_history_store_bytes", history_store.disk_usage())
+    elif HISTORY_BACKEND == "intervals":
+        with db_reader() as conn:
+            set_gauge(
+                "petcalc_listing_intervals",
+                conn.execute("SELECT COUNT(*) FROM pet_listings").fetchone()[0],
+            )
+    set_gauge("petcalc_sse_subscribers", len(event_subscribers))
+
+    lines = []
+    with metrics_lock:
+        for name, (metric_type, help_text) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            if metric_type != "histogram":
+                for (series, labels), value in sorted(metric_values.items()):
+                    if series == name:
+                        lines.append(f"{name}{format_labels(labels)} {value}")
+                continue
+            for (series, labels), histogram in sorted(metric_histograms.items()):
+                if series != name:
+                    continue
+                for bound, count in zip(METRIC_BUCKETS, histogram["buckets"]):
+                    lines.append(f"{name}_bucket{format_labels(labels, le=bound)} {count}")
+                lines.append(
+                    f'{name}_bucket{format_labels(labels, le="+Inf")} {histogram["count"]}'
+                )
+                lines.append(f"{name}_sum{format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+@app.route("/metrics")
+def metrics():
+    return app.response_class(
+        render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+def request_profile(cycles):
+    global profile_cycles_remaining
+    profile_cycles_remaining = min(max(0, cycles), MAX_PROFILE_CYCLES)
+    return {"profile_cycles_remaining": profile_cycles_remaining, "profile_dir": PROFILE_DIR}
+
+
+@app.route("/metrics/profile", methods=["POST"])
+def profile_cycles():
+    try:
+        cycles = int(request.values.get("cycles", 1))
+    except ValueError:
+        return jsonify({"error": "cycles must be an integer"}), 400
+    return jsonify(request_profile(cycles))
+
+
+async def profile_coroutine(coro, profiler):
+    profiler.enable()
+    try:
+        return await coro
+    finally:
+        profiler.disable()
+
+
+def run_profiled(func):
+    """Run one ingestion cycle under cProfile and dump the stats to PROFILE_DIR.
+
+    Coroutines the cycle hands to the shared event loop are profiled on the
+    loop's thread as well and merged into the same dump. From Python 3.12
+    cProfile sees every thread but only one profiler may be active, so the
+    loop then needs no profiler of its own.
+    """
+    global loop_profiler
+    profiler = cProfile.Profile()
+    if sys.version_info < (3, 12):
+        loop_profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func()
+    finally:
+        profiler.disable()
+        stats = pstats.Stats(profiler)
+        if loop_profiler is not None and loop_profiler.getstats():
+            stats.add(loop_profiler)
+        loop_profiler = None
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(
+            PROFILE_DIR, f"cycle-{datetime.now().strftime('%Y%m%d-%H%M%S')}.prof"
+        )
+        stats.dump_stats(path)
+        logging.info(f"Wrote ingestion profile to {path}")
+
+
 API_URL = "https://api.hypixel.net/v2/skyblock/auctions"
+ENDED_API_URL = "https://api.hypixel.net/v2/skyblock/auctions_ended"
+
+# Incremental mode only downloads page 0 between full snapshots; a full
+# resync happens every FULL_RESYNC_EVERY cycles. The auctions_ended feed only
+# covers about the last minute, so it is polled every ENDED_POLL_SECONDS in
+# between to evict sold listings. Cancelled listings never show up in it and
+# stay until their end or the next resync.
+INCREMENTAL_UPDATES = os.environ.get("PETCALC_INCREMENTAL_UPDATES") == "1"
+FULL_RESYNC_EVERY = 6
+ENDED_POLL_SECONDS = 60
+
+# Auction fetch tuning
+FETCH_CONCURRENCY = 16
+FETCH_RETRIES = 3
+FETCH_BACKOFF_SECONDS = 0.5
+FETCH_TIMEOUT_SECONDS = 15
+
+# Auction pages are decoded straight into the few fields extraction reads;
+# see auction_decoder for the choices
+PAGE_DECODER, decode_page = auction_decoder.get_decoder(
+    os.environ.get("PETCALC_PAGE_DECODER", "auto")
+)
+
+# With PARSE_WORKERS set, pages are decoded and reduced in that many worker
+# processes instead of on the event loop thread; only the reduced results
+# come back. Workers are spawned rather than forked: the pool starts while
+# the scheduler and request threads run, and a forked child could inherit a
+# lock one of them holds. A spawned worker re-imports the main module, which
+# skips the start-up at the bottom of this file (see is_main_process).
+PARSE_WORKERS = int(os.environ.get("PETCALC_PARSE_WORKERS", "0"))
+parse_pool = None
+parse_pool_lock = threading.Lock()
+
+# Per-page latency and retry counts of the most recent snapshot fetch
+last_fetch_stats = {}
+
 RARITY_COLORS = {
     "COMMON": "gray",
     "UNCOMMON": "green",
@@ -87,6 +1029,15 @@ RARITY_COLORS = {
     "MYTHIC": "#FF94E3",
 }
 DEFAULT_SKILL = "Mining"
+SKILLS = ["Mining", "Fishing", "Combat", "Farming", "Foraging", "Enchanting", "Alchemy"]
+
+# Bumped after every successful ingestion cycle; cached /analyze responses
+# from an older generation are recomputed on the next request, and so are
+# responses holding a listing that turned older than MAX_LISTING_AGE_HOURS,
+# in case ingestion keeps failing.
+ingestion_generation = 0
+analysis_cache = {}
+MAX_LISTING_AGE_HOURS = 0.0833  # 5 minutes
 
 XP_REQUIRED = {
     "COMMON": 5624785,
@@ -98,6 +1049,10 @@ XP_REQUIRED = {
 }
 
 
+class SnapshotError(Exception):
+    """Raised when an auction snapshot can't be fetched completely."""
+
+
 @app.route("/favicon.ico")
 def favicon():
     return send_from_directory(
@@ -112,40 +1067,306 @@ def index():
     return render_template("index.html")
 
 
-@app.route("/analyze", methods=["POST"])
+# Ranking responses come as a list of row objects ("rows") or as one list per
+# key ("columns"), which drops the repeated keys. Bodies of at least
+# MIN_COMPRESS_BYTES are also stored gzipped and, if brotli is installed,
+# brotli-compressed, and served according to the client's Accept-Encoding.
+RESPONSE_FORMATS = ("rows", "columns")
+MIN_COMPRESS_BYTES = 512
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def encode_json(data):
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+    return json.dumps(data, sort_keys=True, separators=(",", ":")).encode()
+
+
+def to_columns(rows):
+    if not rows:
+        return {}
+    return {key: [row[key] for row in rows] for key in rows[0]}
+
+
+def shape_response(rows, response_format):
+    return to_columns(rows) if response_format == "columns" else rows
+
+
+def encode_bodies(data):
+    """Serialize ``data`` once and return its body per content coding."""
+    body = encode_json(data)
+    bodies = {"identity": body}
+    if len(body) >= MIN_COMPRESS_BYTES:
+        bodies["gzip"] = gzip.compress(body, GZIP_LEVEL)
+        if brotli is not None:
+            bodies["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+    return bodies
+
+
+def choose_encoding(accept_encoding, bodies):
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.partition(";")
+        params = params.replace(" ", "")
+        if params.startswith("q="):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(coding.strip().lower())
+    for coding in ("br", "gzip"):
+        if coding in bodies and (coding in accepted or "*" in accepted):
+            return coding
+    return "identity"
+
+
+def encoded_json_response(bodies, etag=None):
+    encoding = choose_encoding(request.headers.get("Accept-Encoding"), bodies)
+    if etag is not None and etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(bodies[encoding], mimetype="application/json")
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    if etag is not None:
+        response.set_etag(etag)
+        response.headers["Cache-Control"] = "no-cache"
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def get_response_format():
+    response_format = request.values.get("format", "rows")
+    return response_format if response_format in RESPONSE_FORMATS else None
+
+
+@app.route("/analyze", methods=["GET", "POST"])
 def analyze_auctions():
-    selected_skill = request.form.get("skill", DEFAULT_SKILL)
-    return jsonify(asyncio.run(fetch_and_analyze_auctions(selected_skill)))
+    selected_skill = request.values.get("skill", DEFAULT_SKILL)
+    response_format = get_response_format()
+    if response_format is None:
+        return jsonify({"error": f"format must be one of {', '.join(RESPONSE_FORMATS)}"}), 400
+    if selected_skill not in SKILLS:
+        output_list = fetch_and_analyze_auctions(selected_skill)
+        return encoded_json_response(encode_bodies(shape_response(output_list, response_format)))
+
+    cached = get_cached_analysis(selected_skill)
+    return encoded_json_response(
+        cached["bodies"][response_format], cached["etags"][response_format]
+    )
+
+
+def analysis_expiry():
+    """When the oldest listing /analyze would still show gets too old, or None."""
+    max_age = timedelta(hours=MAX_LISTING_AGE_HOURS)
+    with db_reader() as conn:
+        oldest = conn.execute(
+            "SELECT MIN(timestamp) FROM pet_price_summary WHERE timestamp >= ?",
+            (datetime.now() - max_age,),
+        ).fetchone()[0]
+    return datetime.fromisoformat(oldest) + max_age if oldest else None
+
+
+def build_cached_analysis(selected_skill, generation):
+    # Taken before the rows are read, so it can only be early
+    expires = analysis_expiry()
+    output_list = fetch_and_analyze_auctions(selected_skill)
+    bodies, etags = {}, {}
+    for response_format in RESPONSE_FORMATS:
+        bodies[response_format] = encode_bodies(shape_response(output_list, response_format))
+        etags[response_format] = hashlib.md5(
+            bodies[response_format]["identity"]
+        ).hexdigest()
+    return {
+        "generation": generation,
+        "expires": expires,
+        "rows": output_list,
+        "bodies": bodies,
+        "etags": etags,
+        "etag": etags["rows"],
+    }
+
+
+def get_cached_analysis(selected_skill):
+    generation = ingestion_generation
+    cached = analysis_cache.get(selected_skill)
+    if (
+        cached is None
+        or cached["generation"] != generation
+        or (cached["expires"] is not None and datetime.now() >= cached["expires"])
+    ):
+        inc_counter("petcalc_analyze_cache_requests_total", result="miss")
+        cached = build_cached_analysis(selected_skill, generation)
+        analysis_cache[selected_skill] = cached
+    else:
+        inc_counter("petcalc_analyze_cache_requests_total", result="hit")
+    return cached
+
+
+def warm_analysis_cache():
+    """Precompute the /analyze response of every skill for the current generation."""
+    for skill in SKILLS:
+        get_cached_analysis(skill)
+
+
+SSE_KEEPALIVE_SECONDS = 30
+# Streams end after this long, so browsers reconnect and resynchronise
+SSE_MAX_STREAM_SECONDS = 600
+
+# Open /events streams. Each subscriber registers a skill and a ``deliver``
+# callback that queues an already formatted SSE message for its connection.
+event_subscribers = {}
+event_subscribers_lock = threading.Lock()
+# The etag and rows, keyed by (name, rarity), of the last ranking pushed per
+# skill, to diff against
+published_rankings = {}
+
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def subscribe_events(skill, deliver):
+    token = object()
+    with event_subscribers_lock:
+        event_subscribers[token] = (skill, deliver)
+    return token
+
+
+def unsubscribe_events(token):
+    with event_subscribers_lock:
+        event_subscribers.pop(token, None)
+
+
+def is_subscribed(token):
+    """False once the subscriber was dropped; its stream should end then."""
+    with event_subscribers_lock:
+        return token in event_subscribers
+
+
+def publish_event(message, skill=None):
+    """Hand ``message`` to every subscriber, or only to those of ``skill``."""
+    with event_subscribers_lock:
+        subscribers = list(event_subscribers.items())
+    for token, (subscribed_skill, deliver) in subscribers:
+        if skill is not None and subscribed_skill != skill:
+            continue
+        try:
+            deliver(message)
+        except Exception:
+            # A subscriber that can't keep up is dropped; its stream ends and
+            # the client reconnects and refetches the ranking
+            unsubscribe_events(token)
+
+
+def diff_rankings(previous, rows):
+    current = {(row["name"], row["rarity"]): row for row in rows}
+    changed = [row for key, row in current.items() if previous.get(key) != row]
+    removed = [list(key) for key in previous if key not in current]
+    return current, changed, removed
+
+
+def publish_ranking_updates():
+    """Push the rows that changed this cycle, per skill, plus the new countdown.
+
+    Each diff names the etag of the ranking it applies to, so a client that
+    missed one can tell and refetch /analyze instead. Etags, unlike
+    generations, are the same in every worker.
+    """
+    for skill in SKILLS:
+        cached = get_cached_analysis(skill)
+        base_etag, previous = published_rankings.get(skill, (None, {}))
+        current, changed, removed = diff_rankings(previous, cached["rows"])
+        published_rankings[skill] = (cached["etag"], current)
+        if changed or removed:
+            publish_event(
+                format_sse(
+                    "rankings",
+                    {
+                        "generation": cached["generation"],
+                        "base_etag": base_etag,
+                        "etag": cached["etag"],
+                        "changed": changed,
+                        "removed": removed,
+                    },
+                ),
+                skill=skill,
+            )
+    publish_event(format_sse("countdown", get_timer_status()))
+
+
+@app.route("/events")
+def events():
+    """Server-Sent Events stream of ranking diffs and update countdowns.
+
+    A stream occupies a thread for as long as it is open, so WSGI servers
+    need threaded or gevent workers (e.g. gunicorn -k gthread or -k gevent)
+    for it. A sync worker answers 501 and the page polls instead; the
+    aiohttp server in async_server.py has no such limit.
+    """
+    if not request.environ.get("wsgi.multithread"):
+        return jsonify({"error": "Event streams need a threaded or async worker"}), 501
+    skill = request.args.get("skill", DEFAULT_SKILL)
+    messages = queue.Queue(maxsize=100)
+    token = subscribe_events(skill, messages.put_nowait)
+
+    def stream():
+        deadline = time.monotonic() + SSE_MAX_STREAM_SECONDS
+        try:
+            yield format_sse("countdown", get_timer_status())
+            while is_subscribed(token) and time.monotonic() < deadline:
+                try:
+                    yield messages.get(timeout=SSE_KEEPALIVE_SECONDS)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            unsubscribe_events(token)
+
+    return app.response_class(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.route("/search", methods=["POST"])
 def search_pet():
     search_term = request.form.get("search_term", "").strip()
     selected_skill = request.form.get("skill", DEFAULT_SKILL)
+    response_format = get_response_format()
+    if response_format is None:
+        return jsonify({"error": f"format must be one of {', '.join(RESPONSE_FORMATS)}"}), 400
+    output_list = search_pets(search_term, selected_skill)
+    return encoded_json_response(encode_bodies(shape_response(output_list, response_format)))
 
-    conn = sqlite3.connect("pet_prices.db")
-    c = conn.cursor()
 
-    query = """
-    SELECT pet_name, rarity, 
-           MIN(CASE WHEN level = 'low' THEN price END) as low_price,
+def search_pets(search_term, selected_skill):
+    reference = get_reference_data()
+    pet_names = resolve_search_term(search_term, reference)
+    if not pet_names:
+        return []
+
+    placeholders = ",".join("?" for _ in pet_names)
+    query = f"""
+    SELECT pet_name, rarity,
+           MAX(CASE WHEN level = 'low' THEN price END) as low_price,
            MAX(CASE WHEN level = 'high' THEN price END) as high_price,
-           MIN(CASE WHEN level = 'low' THEN uuid END) as low_uuid,
+           MAX(CASE WHEN level = 'low' THEN uuid END) as low_uuid,
            MAX(CASE WHEN level = 'high' THEN uuid END) as high_uuid,
-           AVG(CASE WHEN level = 'low' AND timestamp > datetime('now', '-1 day') THEN price END) as low_day_avg,
-           AVG(CASE WHEN level = 'low' AND timestamp > datetime('now', '-7 day') THEN price END) as low_week_avg,
-           AVG(CASE WHEN level = 'high' AND timestamp > datetime('now', '-1 day') THEN price END) as high_day_avg,
-           AVG(CASE WHEN level = 'high' AND timestamp > datetime('now', '-7 day') THEN price END) as high_week_avg
-    FROM pet_prices
-    WHERE LOWER(pet_name) LIKE ?
+           MAX(CASE WHEN level = 'low' THEN CAST(day_sum AS REAL) / NULLIF(day_count, 0) END) as low_day_avg,
+           MAX(CASE WHEN level = 'low' THEN CAST(week_sum AS REAL) / NULLIF(week_count, 0) END) as low_week_avg,
+           MAX(CASE WHEN level = 'high' THEN CAST(day_sum AS REAL) / NULLIF(day_count, 0) END) as high_day_avg,
+           MAX(CASE WHEN level = 'high' THEN CAST(week_sum AS REAL) / NULLIF(week_count, 0) END) as high_week_avg
+    FROM pet_price_summary
+    WHERE pet_name IN ({placeholders})
     GROUP BY pet_name, rarity
     """
 
-    c.execute(query, (f"%{search_term}%",))
-    results = c.fetchall()
-    conn.close()
+    with db_reader() as conn:
+        results = conn.execute(query, pet_names).fetchall()
 
-    pet_list = load_pet_list("petlist.json")
     output_list = []
 
     for row in results:
@@ -166,44 +1387,19 @@ def search_pet():
         if low_price is None or high_price is None:
             continue
 
-        # Find the skill for this pet
-        skill = next(
-            (
-                key
-                for category in pet_list
-                for key, pets in category.items()
-                if pet_name in pets
-            ),
-            None,
-        )
-
+        skill = reference["pet_skills"].get(pet_name)
         if skill is None:
             continue  # Skip this pet if we can't determine its skill
 
-        if pet_name == "Golden Dragon":
-            xp_required = get_golden_dragon_xp()
-        else:
-            xp_required = XP_REQUIRED[rarity]
+        xp_required = reference["xp_required"][pet_name][rarity]
 
-        gross_profit = high_price - low_price
-        ah_tax = calculate_ah_tax(high_price)
-        claim_tax = gross_profit * 0.01
-        net_profit = gross_profit - ah_tax - claim_tax
-        profit_without_tax = gross_profit
+        net_profit = calculate_net_profit(low_price, high_price)
+        profit_without_tax = high_price - low_price
 
         coins_per_xp = net_profit / xp_required if xp_required else 0
-        coins_per_xp = round(coins_per_xp, 2)
-
-        coins_per_xp_note = None
-        if (
-            selected_skill in ["Mining", "Fishing", "Combat", "Farming", "Foraging"]
-            and skill != selected_skill
-        ):
-            coins_per_xp /= 4
-            coins_per_xp_note = f" /4 because its not a {selected_skill} Pet"
-        elif selected_skill in ["Enchanting", "Alchemy"] and skill != selected_skill:
-            coins_per_xp /= 12
-            coins_per_xp_note = f" /12 not a {selected_skill} Pet"
+        coins_per_xp, coins_per_xp_note = adjust_for_skill(
+            round(coins_per_xp, 2), skill, selected_skill
+        )
 
         output_list.append(
             {
@@ -226,7 +1422,7 @@ def search_pet():
         )
 
     output_list.sort(key=lambda x: x["coins_per_xp"], reverse=True)
-    return jsonify(output_list)
+    return output_list
 
 
 @app.route("/images/pets/<path:filename>")
@@ -234,68 +1430,389 @@ def get_pet_image(filename):
     return send_from_directory("images/pets", filename)
 
 
-async def fetch_auctions():
-    total_auctions = []
+# One long-lived event loop, running on its own thread unless a server hands
+# us its loop, owns every auction fetch and the aiohttp session they share so
+# connections are reused across cycles.
+event_loop = None
+event_loop_lock = threading.Lock()
+fetch_session = None
+
+
+def use_event_loop(loop):
+    """Run coroutines on ``loop`` (already running elsewhere) from now on."""
+    global event_loop
+    event_loop = loop
+
+
+def get_event_loop():
+    global event_loop
+    with event_loop_lock:
+        if event_loop is None or event_loop.is_closed():
+            loop = asyncio.new_event_loop()
+            threading.Thread(
+                target=loop.run_forever, name="event-loop", daemon=True
+            ).start()
+            event_loop = loop
+            atexit.register(
+                lambda: asyncio.run_coroutine_threadsafe(close_fetch_session(), loop).result(5)
+            )
+    return event_loop
+
+
+def run_coroutine(coro):
+    """Run ``coro`` on the shared event loop and block until it finishes."""
+    if loop_profiler is not None:
+        coro = profile_coroutine(coro, loop_profiler)
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+async def get_fetch_session():
+    global fetch_session
+    if fetch_session is None or fetch_session.closed:
+        fetch_session = create_fetch_session()
+    return fetch_session
+
+
+async def close_fetch_session():
+    if fetch_session is not None and not fetch_session.closed:
+        await fetch_session.close()
+
+
+def create_fetch_session():
+    connector = aiohttp.TCPConnector(
+        limit=FETCH_CONCURRENCY,
+        keepalive_timeout=30,
+        ttl_dns_cache=300,
+    )
+    timeout = aiohttp.ClientTimeout(total=FETCH_TIMEOUT_SECONDS)
+    return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+
+async def fetch_auctions(on_page, since=None, max_pages=None, page_reducer=None):
+    """Fetch every auction page and hand each one to ``on_page`` as it arrives.
+
+    Pages are not accumulated, so callers should reduce them to whatever they
+    need inside ``on_page``. If page 0 reports the same ``lastUpdated`` as
+    ``since`` nothing is handed on and the remaining pages are not requested.
+    ``max_pages`` limits how many pages are fetched.
+
+    With ``page_reducer``, ``on_page`` gets ``page_reducer(auctions)`` instead
+    of the auctions. The reducer runs next to the decoder, in the parse pool
+    when PARSE_WORKERS is set, so it has to pickle: use an auction_decoder
+    function, bound with ``functools.partial`` if needed.
+
+    Every page must belong to the same snapshot as page 0; a page that still
+    fails after FETCH_RETRIES or comes from another snapshot raises
+    SnapshotError, so callers never see a partial snapshot as complete.
+
+    Must run on the shared event loop (see ``run_coroutine``).
+
+    Returns ``(auction_count, last_updated)``.
+    """
+    global last_fetch_stats
+    stats = {"pages": {}, "started": time.time(), "extract": 0.0}
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+    auction_count = 0
+    session = await get_fetch_session()
+
+    data = await fetch_page(session, 0, semaphore, stats, page_reducer)
+    if "totalPages" not in data:
+        raise SnapshotError("Invalid API response: 'totalPages' missing")
+
+    last_updated = data.get("lastUpdated")
+    if since is not None and last_updated == since:
+        logging.info(f"Auction snapshot {last_updated} unchanged")
+        return 0, last_updated
+
+    def reduce_page(page_data):
+        started = time.perf_counter()
+        on_page(page_data["auctions"])
+        stats["extract"] += time.perf_counter() - started + page_data["reduce_seconds"]
+
+    total_pages = data["totalPages"]
+    reduce_page(data)
+    auction_count += data["auction_count"]
+    del data
+
+    pages_to_fetch = total_pages
+    if max_pages is not None:
+        pages_to_fetch = min(total_pages, max_pages)
+    logging.info(
+        f"Fetching {pages_to_fetch} pages of auctions ({PAGE_DECODER} decoder, "
+        f"{PARSE_WORKERS or 'no'} parse workers)"
+    )
+
+    tasks = [
+        asyncio.ensure_future(fetch_page(session, page, semaphore, stats, page_reducer))
+        for page in range(1, pages_to_fetch)
+    ]
+    try:
+        for next_page in asyncio.as_completed(tasks):
+            page_data = await next_page
+            if page_data.get("lastUpdated") != last_updated:
+                raise SnapshotError(
+                    f"Page {page_data.get('page')} belongs to snapshot "
+                    f"{page_data.get('lastUpdated')}, expected {last_updated}"
+                )
+            reduce_page(page_data)
+            auction_count += page_data["auction_count"]
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Collect what the cancelled pages raised so an aborted snapshot
+        # doesn't leave unretrieved task exceptions behind
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    stats["duration"] = time.time() - stats["started"]
+    last_fetch_stats = stats
+    observe(
+        "petcalc_ingest_stage_seconds",
+        sum(page["decode"] for page in stats["pages"].values()),
+        stage="decode",
+    )
+    observe("petcalc_ingest_stage_seconds", stats["extract"], stage="extract")
+    inc_counter("petcalc_auctions_fetched_total", auction_count)
+    latencies = sorted(page["latency"] for page in stats["pages"].values())
+    retries = sum(page["retries"] for page in stats["pages"].values())
+    logging.info(
+        f"Fetched a total of {auction_count} auctions from {len(latencies)} pages "
+        f"in {stats['duration']:.2f}s (median page {latencies[len(latencies) // 2]:.2f}s, "
+        f"slowest {latencies[-1]:.2f}s, {retries} retries)"
+    )
+    return auction_count, last_updated
+
+
+async def fetch_ended_auction_ids():
+    """Return the uuids of auctions that ended (sold or cancelled) recently."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(API_URL) as response:
-                if response.status != 200:
-                    logging.error(f"Failed to fetch initial page: HTTP {response.status}")
-                    return []
-
-                data = await response.json()
-                if "totalPages" not in data or "auctions" not in data:
-                    logging.error("Invalid API response: 'totalPages' or 'auctions' missing")
-                    return []
-
-                total_pages = data["totalPages"]
-                total_auctions.extend(data["auctions"])
-                logging.info(f"Fetching {total_pages} pages of auctions")
-
-                tasks = [fetch_page(session, page, total_pages) for page in range(1, total_pages)]
-                results = await asyncio.gather(*tasks)
-                for page_auctions in results:
-                    total_auctions.extend(page_auctions)
-
-        logging.info(f"Fetched a total of {len(total_auctions)} auctions")
-        return total_auctions
+        session = await get_fetch_session()
+        async with session.get(ENDED_API_URL) as response:
+            if response.status != 200:
+                logging.error(f"Failed to fetch ended auctions: HTTP {response.status}")
+                return []
+            data = await response.json()
+            return [auction["auction_id"] for auction in data.get("auctions", [])]
     except Exception as e:
-        logging.error(f"Error fetching auctions: {str(e)}")
+        logging.error(f"Error fetching ended auctions: {str(e)}")
         return []
 
 
-async def fetch_page(session, page, total_pages):
-    url = f"{API_URL}?page={page}"
+def get_parse_pool():
+    """Return the parse pool, starting it on first use; None without PARSE_WORKERS."""
+    global parse_pool
+    if not PARSE_WORKERS:
+        return None
+    with parse_pool_lock:
+        if parse_pool is None:
+            parse_pool = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+            atexit.register(shutdown_parse_pool)
+        return parse_pool
+
+
+def shutdown_parse_pool():
+    global parse_pool
+    with parse_pool_lock:
+        pool, parse_pool = parse_pool, None
+    if pool is not None:
+        pool.shutdown(cancel_futures=True)
+
+
+async def parse_page_body(body, page_reducer):
+    """Decode and reduce one page, in the parse pool if there is one."""
+    global parse_pool
+    pool = get_parse_pool()
+    if pool is None:
+        return auction_decoder.parse_page(body, PAGE_DECODER, page_reducer)
     try:
-        async with session.get(url) as response:
-            if response.status == 200:
-                data = await response.json()
-                if "auctions" in data:
-                    logging.info(f"Successfully fetched page {page}/{total_pages}")
-                    return data["auctions"]
-                else:
-                    logging.error(f"Invalid API response on page {page}: 'auctions' missing")
-            else:
-                logging.error(f"Failed to fetch page {page}: HTTP {response.status}")
-    except Exception as e:
-        logging.error(f"Exception while fetching page {page}: {str(e)}")
-    return []
+        return await asyncio.get_running_loop().run_in_executor(
+            pool, auction_decoder.parse_page, body, PAGE_DECODER, page_reducer
+        )
+    except BrokenProcessPool:
+        # A worker died; start a fresh pool for the next attempt
+        with parse_pool_lock:
+            if parse_pool is pool:
+                parse_pool = None
+        raise SnapshotError("A parse worker died while decoding a page")
+
+
+async def fetch_page(session, page, semaphore, stats, page_reducer=None):
+    """Fetch and parse one page, retrying with jittered exponential backoff.
+
+    Records the page's network latency, decode time and retry count in
+    ``stats``. The body is parsed after the connection and semaphore slot
+    are released, so downloads continue while the parse pool works.
+    """
+    url = f"{API_URL}?page={page}"
+    for attempt in range(FETCH_RETRIES + 1):
+        started = time.time()
+        try:
+            body = None
+            async with semaphore:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        body = await response.read()
+                    else:
+                        logging.error(f"Failed to fetch page {page}: HTTP {response.status}")
+            if body is not None:
+                latency = time.time() - started
+                data = await parse_page_body(body, page_reducer)
+                stats["pages"][page] = {
+                    "latency": latency,
+                    "decode": data["decode_seconds"],
+                    "retries": attempt,
+                }
+                observe("petcalc_fetch_page_seconds", latency)
+                observe("petcalc_fetch_page_decode_seconds", data["decode_seconds"])
+                logging.debug(f"Successfully fetched page {page}")
+                return data
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logging.error(f"Exception while fetching page {page}: {str(e)}")
+
+        if attempt < FETCH_RETRIES:
+            inc_counter("petcalc_fetch_page_retries_total")
+            delay = FETCH_BACKOFF_SECONDS * 2**attempt * random.uniform(0.5, 1.5)
+            await asyncio.sleep(delay)
+
+    raise SnapshotError(f"Page {page} failed after {FETCH_RETRIES} retries")
+
+
+def get_level_range(pet):
+    """Return the (low, high) pet levels we price for a pet."""
+    if pet == "Golden Dragon":
+        return 102, 200
+    return 1, 100
+
+
+def build_tracked_pets(pet_list):
+    """Set of every pet name we price."""
+    return {pet for category in pet_list for pets in category.values() for pet in pets}
+
+
+# Live pet listings kept between cycles for incremental updates. "auctions"
+# maps uuid -> (key, price, end) and "heaps" holds a (price, uuid) min-heap
+# per (tier, pet, level); entries for evicted uuids are dropped lazily.
+price_book = {
+    "last_updated": None,
+    "cycles_since_resync": 0,
+    "auctions": {},
+    "heaps": defaultdict(list),
+}
+
+
+def add_to_price_book(auctions, tracked_pets, book):
+    for auction in auctions:
+        key = auction_decoder.parse_pet_auction(auction, tracked_pets)
+        if key is None:
+            continue
+        uuid = auction.get("uuid")
+        if uuid is None or uuid in book["auctions"]:
+            continue
+
+        price = auction["starting_bid"]
+        book["auctions"][uuid] = (key, price, auction.get("end"))
+        heapq.heappush(book["heaps"][key], (price, uuid))
+
+
+def evict_from_price_book(uuids, book):
+    for uuid in uuids:
+        book["auctions"].pop(uuid, None)
+
+
+def price_book_minimums(book):
+    """Cheapest live listing per key, discarding evicted and expired entries."""
+    now_ms = time.time() * 1000
+    min_auctions = {}
+    for key, heap in book["heaps"].items():
+        while heap:
+            price, uuid = heap[0]
+            live = book["auctions"].get(uuid)
+            if live is not None and (live[2] is None or live[2] > now_ms):
+                break
+            heapq.heappop(heap)
+            book["auctions"].pop(uuid, None)
+        if heap:
+            price, uuid = heap[0]
+            min_auctions[key] = {"starting_bid": price, "uuid": uuid}
+    return min_auctions
+
+
+async def refresh_price_book(tracked_pets):
+    """Bring ``price_book`` up to date and return the current minimums.
+
+    A full snapshot is downloaded on the first cycle and every
+    FULL_RESYNC_EVERY cycles after that. In between only page 0, where new
+    listings land, is fetched; sold listings are evicted using the
+    auctions_ended feed, here and in poll_ended_auctions. Unchanged
+    snapshots are not downloaded at all.
+    """
+    global price_book
+    full_resync = (
+        price_book["last_updated"] is None
+        or price_book["cycles_since_resync"] >= FULL_RESYNC_EVERY
+    )
+
+    if full_resync:
+        book = {
+            "last_updated": None,
+            "cycles_since_resync": 0,
+            "auctions": {},
+            "heaps": defaultdict(list),
+        }
+        auction_count, last_updated = await fetch_auctions(
+            lambda page: add_to_price_book(page, tracked_pets, book),
+            page_reducer=partial(auction_decoder.page_pet_auctions, tracked_pets=tracked_pets),
+        )
+        if not auction_count:
+            raise RuntimeError("Full auction snapshot came back empty")
+        # Listings sold while the pages were downloading
+        evict_from_price_book(await fetch_ended_auction_ids(), book)
+        book["last_updated"] = last_updated
+        price_book = book
+        logging.info(f"Price book resynced with {len(book['auctions'])} listings")
+    else:
+        book = price_book
+        book["cycles_since_resync"] += 1
+        auction_count, last_updated = await fetch_auctions(
+            lambda page: add_to_price_book(page, tracked_pets, book),
+            since=book["last_updated"],
+            page_reducer=partial(auction_decoder.page_pet_auctions, tracked_pets=tracked_pets),
+            max_pages=1,
+        )
+        if last_updated != book["last_updated"]:
+            evict_from_price_book(await fetch_ended_auction_ids(), book)
+            book["last_updated"] = last_updated
+        logging.info(f"Price book delta applied from {auction_count} auctions")
+
+    return price_book_minimums(book)
+
+
+async def evict_ended_auctions():
+    evict_from_price_book(await fetch_ended_auction_ids(), price_book)
+
 
+def poll_ended_auctions():
+    """Evict listings sold since the last poll, between incremental cycles."""
+    if price_book["last_updated"] is not None:
+        run_coroutine(evict_ended_auctions())
 
-async def fetch_and_analyze_auctions(selected_skill):
-    pet_list = load_pet_list("petlist.json")
+
+def fetch_and_analyze_auctions(selected_skill):
+    pet_list = get_reference_data()["pet_list"]
     pet_data = fetch_pet_data_from_db()
     output_list = calculate_profit_from_db(pet_list, pet_data, selected_skill)
     return output_list
 
 
 def calculate_profit_from_db(
-    pet_list, pet_data, selected_skill, max_age_hours=0.0833
-):  # 5 minutes
+    pet_list, pet_data, selected_skill, max_age_hours=MAX_LISTING_AGE_HOURS
+):
     logging.debug(f"Pet data structure: {json.dumps(pet_data, indent=2)}")
     new_pet_list = []
     current_time = datetime.now()
     max_age = timedelta(hours=max_age_hours)
+    xp_required_by_pet = get_reference_data()["xp_required"]
 
     for category in pet_list:
         for key, pets in category.items():
@@ -332,10 +1849,7 @@ def calculate_profit_from_db(
                     ):
                         continue
 
-                    if pet == "Golden Dragon":
-                        xp_required = get_golden_dragon_xp()
-                    else:
-                        xp_required = XP_REQUIRED[rarity]
+                    xp_required = xp_required_by_pet[pet][rarity]
 
                     low_price = pet_info.get("low_price", 0)
                     high_price = pet_info.get("high_price", 0)
@@ -348,31 +1862,13 @@ def calculate_profit_from_db(
 
                     # Only calculate profit if both low and high prices are available for the same rarity
                     if low_price and high_price:
-                        gross_profit = high_price - low_price
-                        ah_tax = calculate_ah_tax(high_price)
-                        claim_tax = gross_profit * 0.01
-                        net_profit = gross_profit - ah_tax - claim_tax
-                        profit_without_tax = gross_profit
+                        net_profit = calculate_net_profit(low_price, high_price)
+                        profit_without_tax = high_price - low_price
 
                         coins_per_xp = net_profit / xp_required if xp_required else 0
-                        coins_per_xp = round(coins_per_xp, 2)
-
-                        coins_per_xp_note = None
-                        if (
-                            selected_skill
-                            in ["Mining", "Fishing", "Combat", "Farming", "Foraging"]
-                            and key != selected_skill
-                        ):
-                            coins_per_xp /= 4
-                            coins_per_xp_note = (
-                                f" /4 because its not a {selected_skill} Pet"
-                            )
-                        elif (
-                            selected_skill in ["Enchanting", "Alchemy"]
-                            and key != selected_skill
-                        ):
-                            coins_per_xp /= 12
-                            coins_per_xp_note = f" /12 not a {selected_skill} Pet"
+                        coins_per_xp, coins_per_xp_note = adjust_for_skill(
+                            round(coins_per_xp, 2), key, selected_skill
+                        )
 
                         new_pet_list.append(
                             {
@@ -403,6 +1899,130 @@ def load_pet_list(file_path):
         return json.load(f)
 
 
+PET_LIST_PATH = "petlist.json"
+GOLDEN_DRAGON_PATH = "GoldenDragon.json"
+PET_LEVELS_PATH = "PetLevels.json"
+
+# Static pet data shared by every request and ingestion cycle, reloaded when
+# one of the files it was built from changes on disk.
+reference_data = None
+reference_data_lock = threading.Lock()
+
+
+def load_reference_data():
+    pet_list = load_pet_list(PET_LIST_PATH)
+    with open(GOLDEN_DRAGON_PATH, "r") as f:
+        levels = json.load(f)["levels"]
+    golden_dragon_xp = levels[-1]["totalXP"] - levels[0]["totalXP"]
+    with open(PET_LEVELS_PATH, "r") as f:
+        rarity_curves = build_xp_curves(json.load(f))
+    golden_dragon_curve = dict(rarity_curves["LEGENDARY"])
+    golden_dragon_curve.update({level["level"]: level["totalXP"] for level in levels})
+
+    pet_skills = {
+        pet: skill
+        for category in pet_list
+        for skill, pets in category.items()
+        for pet in pets
+    }
+    xp_required = {}
+    xp_curves = {}
+    for pet in pet_skills:
+        if pet == "Golden Dragon":
+            xp_required[pet] = {rarity: golden_dragon_xp for rarity in RARITY_COLORS}
+            xp_curves[pet] = {"LEGENDARY": golden_dragon_curve}
+        else:
+            xp_required[pet] = XP_REQUIRED
+            xp_curves[pet] = rarity_curves
+
+    return {
+        "pet_list": pet_list,
+        "pet_skills": pet_skills,
+        "tracked_pets": set(pet_skills),
+        "xp_required": xp_required,
+        "level_ranges": {pet: get_level_range(pet) for pet in pet_skills},
+        "golden_dragon_xp": golden_dragon_xp,
+        "xp_curves": xp_curves,
+        "search_index": build_search_index(pet_skills),
+    }
+
+
+def build_xp_curves(pet_levels):
+    """Total XP needed to reach each level from level 1, per rarity.
+
+    ``levelXP`` lists the XP of each level-up; a rarity starts reading it at
+    its offset.
+    """
+    curves = {}
+    for rarity, offset in pet_levels["rarityOffsets"].items():
+        total = 0
+        curve = {1: 0}
+        for level in range(2, 101):
+            total += pet_levels["levelXP"][offset + level - 2]
+            curve[level] = total
+        curves[rarity] = curve
+    return curves
+
+
+def normalize_search_term(term):
+    return re.sub(r"[^a-z0-9]", "", term.lower())
+
+
+def build_search_aliases(pet):
+    """Names a pet can be searched by, e.g. "goldendragon", "gdragon", "gd"."""
+    words = re.findall(r"[a-z0-9]+", pet.lower())
+    aliases = {"".join(words)}
+    if len(words) > 1:
+        aliases.add("".join(word[0] for word in words[:-1]) + words[-1])
+        aliases.add("".join(word[0] for word in words))
+    return aliases
+
+
+def build_search_index(pet_names):
+    """Trigram index over every pet's search aliases."""
+    aliases = {pet: build_search_aliases(pet) for pet in pet_names}
+    trigrams = defaultdict(set)
+    for pet, pet_aliases in aliases.items():
+        for alias in pet_aliases:
+            for i in range(len(alias) - 2):
+                trigrams[alias[i : i + 3]].add(pet)
+    return {"aliases": aliases, "trigrams": dict(trigrams)}
+
+
+def resolve_search_term(search_term, reference):
+    """Return the pets whose name or alias contains ``search_term``."""
+    term = normalize_search_term(search_term)
+    index = reference["search_index"]
+    if len(term) < 3:
+        candidates = index["aliases"].keys()
+    else:
+        candidates = set.intersection(
+            *(index["trigrams"].get(term[i : i + 3], set()) for i in range(len(term) - 2))
+        )
+    return [
+        pet
+        for pet in candidates
+        if any(term in alias for alias in index["aliases"][pet])
+    ]
+
+
+def get_reference_data():
+    global reference_data
+    mtimes = tuple(
+        os.path.getmtime(path)
+        for path in (PET_LIST_PATH, GOLDEN_DRAGON_PATH, PET_LEVELS_PATH)
+    )
+    if reference_data is None or reference_data["mtimes"] != mtimes:
+        with reference_data_lock:
+            if reference_data is None or reference_data["mtimes"] != mtimes:
+                data = load_reference_data()
+                data["mtimes"] = mtimes
+                reference_data = data
+                analysis_cache.clear()
+                logging.info(f"Loaded reference data for {len(data['pet_skills'])} pets")
+    return reference_data
+
+
 def filter_pets_by_name(pet_list, search_term):
     filtered_pet_list = []
     for category in pet_list:
@@ -415,13 +2035,11 @@ def filter_pets_by_name(pet_list, search_term):
 
 
 def calculate_profit(pet_list, total_auctions, selected_skill):
-    auctions_by_category = defaultdict(list)
-    for auction in total_auctions:
-        if not auction.get("bin"):
-            continue
-        tier = auction.get("tier")
-        item_name = auction.get("item_name")
-        auctions_by_category[(tier, item_name)].append(auction)
+    reference = get_reference_data()
+    min_auctions = {}
+    auction_decoder.reduce_auction_page(
+        total_auctions, build_tracked_pets(pet_list), min_auctions
+    )
 
     pet_data = []
     for category in pet_list:
@@ -438,22 +2056,13 @@ def calculate_profit(pet_list, total_auctions, selected_skill):
         for key, pets in category.items():
             for tier in RARITY_COLORS.keys():
                 for pet in pets:
-                    if pet == "Golden Dragon":
-                        low_lvl, high_lvl = (
-                            "[Lvl 102] Golden Dragon",
-                            "[Lvl 200] Golden Dragon",
-                        )
-                        xp_required = get_golden_dragon_xp()
-                    else:
-                        low_lvl, high_lvl = f"[Lvl 1] {pet}", f"[Lvl 100] {pet}"
-                        xp_required = XP_REQUIRED[tier]
-
-                    low_pet = find_min_auction(
-                        auctions_by_category.get((tier, low_lvl), [])
-                    )
-                    high_pet = find_min_auction(
-                        auctions_by_category.get((tier, high_lvl), [])
+                    low_level, high_level = reference["level_ranges"].get(
+                        pet, get_level_range(pet)
                     )
+                    xp_required = reference["xp_required"].get(pet, XP_REQUIRED)[tier]
+
+                    low_pet = min_auctions.get((tier, pet, low_level))
+                    high_pet = min_auctions.get((tier, pet, high_level))
 
                     low_day_avg, low_week_avg = average_prices.get(
                         (pet, tier, "low"), (0, 0)
@@ -475,31 +2084,12 @@ def calculate_profit(pet_list, total_auctions, selected_skill):
                     else:
                         continue  # Skip this pet if we have no data
 
-                    gross_profit = high_price - low_price
-                    ah_tax = calculate_ah_tax(high_price)
-                    claim_tax = gross_profit * 0.01
-                    net_profit = gross_profit - ah_tax - claim_tax
-                    profit_without_tax = gross_profit
+                    net_profit = calculate_net_profit(low_price, high_price)
+                    profit_without_tax = high_price - low_price
 
-                    coins_per_xp = net_profit / xp_required
-                    coins_per_xp = round(coins_per_xp, 2)
-
-                    coins_per_xp_note = None
-                    if (
-                        selected_skill
-                        in ["Mining", "Fishing", "Combat", "Farming", "Foraging"]
-                        and key != selected_skill
-                    ):
-                        coins_per_xp /= 4
-                        coins_per_xp_note = (
-                            f" /4 because its not a {selected_skill} Pet"
-                        )
-                    elif (
-                        selected_skill in ["Enchanting", "Alchemy"]
-                        and key != selected_skill
-                    ):
-                        coins_per_xp /= 12
-                        coins_per_xp_note = f" /12 not a {selected_skill} Pet"
+                    coins_per_xp, coins_per_xp_note = adjust_for_skill(
+                        round(net_profit / xp_required, 2), key, selected_skill
+                    )
 
                     new_pet_list.append(
                         {
@@ -525,76 +2115,620 @@ def calculate_profit(pet_list, total_auctions, selected_skill):
     return new_pet_list
 
 
-def calculate_ah_tax(price):
-    if price < 10000000:
-        return price * 0.01
-    elif price < 100000000:
-        return price * 0.02
-    else:
-        return price * 0.025
+# (upper price bound, rate) of each auction house tax bracket; None is open-ended
+AH_TAX_BRACKETS = ((10_000_000, 0.01), (100_000_000, 0.02), (None, 0.025))
+CLAIM_TAX = 0.01
 
 
-def get_golden_dragon_xp():
-    with open("GoldenDragon.json", "r") as f:
-        data = json.load(f)
-    levels = data["levels"]
-    return levels[-1]["totalXP"] - levels[0]["totalXP"]
+def calculate_ah_tax(price, brackets=AH_TAX_BRACKETS):
+    for limit, rate in brackets:
+        if limit is None or price < limit:
+            return price * rate
 
 
-def get_average_prices_batch(pet_data):
-    conn = sqlite3.connect("pet_prices.db")
-    c = conn.cursor()
+def calculate_net_profit(buy_price, sell_price, brackets=AH_TAX_BRACKETS, claim_tax=CLAIM_TAX):
+    """Profit of a flip after the auction house tax on the sale and the claim tax."""
+    gross_profit = sell_price - buy_price
+    return gross_profit - calculate_ah_tax(sell_price, brackets) - gross_profit * claim_tax
+
+
+def off_skill_divisor(selected_skill):
+    """Coins per XP divisor and note for pets levelled outside ``selected_skill``."""
+    if selected_skill in ["Mining", "Fishing", "Combat", "Farming", "Foraging"]:
+        return 4, f" /4 because its not a {selected_skill} Pet"
+    elif selected_skill in ["Enchanting", "Alchemy"]:
+        return 12, f" /12 not a {selected_skill} Pet"
+    return 1, None
+
+
+def adjust_for_skill(coins_per_xp, pet_skill, selected_skill):
+    """Scale coins per XP for pets levelled outside their own skill."""
+    divisor, note = off_skill_divisor(selected_skill)
+    if divisor == 1 or pet_skill == selected_skill:
+        return coins_per_xp, None
+    return coins_per_xp / divisor, note
 
-    now = datetime.now()
-    day_ago = now - timedelta(days=1)
-    week_ago = now - timedelta(days=7)
 
+# Best buy level -> sell level flip per (pet, rarity) from the latest cycle
+best_level_pairs = {}
+
+
+def find_best_level_pairs(min_auctions, reference):
+    """Price every pair of observed levels and keep the best per (pet, rarity).
+
+    For each pet and rarity, every cheaper-level listing is paired with every
+    higher-level one; the pair with the most coins per XP levelled wins.
+    Profit uses the same taxes as calculate_profit.
+    """
+    listings_by_pet = defaultdict(list)
+    for (tier, pet, level), auction in min_auctions.items():
+        listings_by_pet[(pet, tier)].append((level, auction))
+
+    best_pairs = {}
+    for (pet, tier), listings in listings_by_pet.items():
+        curve = reference["xp_curves"].get(pet, {}).get(tier)
+        if curve is None:
+            continue
+        listings = sorted(
+            (level, auction["starting_bid"], auction.get("uuid", "N/A"))
+            for level, auction in listings
+            if level in curve
+        )
+
+        best = None
+        for i, (sell_level, sell_price, sell_uuid) in enumerate(listings):
+            sell_xp = curve[sell_level]
+            for buy_level, buy_price, buy_uuid in listings[:i]:
+                net_profit = calculate_net_profit(buy_price, sell_price)
+                coins_per_xp = net_profit / (sell_xp - curve[buy_level])
+                if best is None or coins_per_xp > best[0]:
+                    best = (
+                        coins_per_xp,
+                        buy_level,
+                        buy_price,
+                        buy_uuid,
+                        sell_level,
+                        sell_price,
+                        sell_uuid,
+                        net_profit,
+                    )
+
+        if best is None:
+            continue
+        coins_per_xp, buy_level, buy_price, buy_uuid, sell_level, sell_price, sell_uuid, net_profit = best
+        best_pairs[(pet, tier)] = {
+            "name": pet,
+            "rarity": tier,
+            "skill": reference["pet_skills"].get(pet),
+            "buy_level": buy_level,
+            "sell_level": sell_level,
+            "buy_price": buy_price,
+            "sell_price": sell_price,
+            "buy_uuid": buy_uuid,
+            "sell_uuid": sell_uuid,
+            "xp_required": curve[sell_level] - curve[buy_level],
+            "profit": int(net_profit),
+            "coins_per_xp": round(coins_per_xp, 2),
+        }
+    return best_pairs
+
+
+def rank_level_pairs(selected_skill):
+    output_list = []
+    for row in best_level_pairs.values():
+        coins_per_xp, coins_per_xp_note = adjust_for_skill(
+            row["coins_per_xp"], row["skill"], selected_skill
+        )
+        output_list.append(
+            {**row, "coins_per_xp": coins_per_xp, "coins_per_xp_note": coins_per_xp_note}
+        )
+    output_list.sort(key=itemgetter("coins_per_xp"), reverse=True)
+    return output_list
+
+
+@app.route("/level_pairs")
+def level_pairs():
+    selected_skill = request.args.get("skill", DEFAULT_SKILL)
+    return jsonify(rank_level_pairs(selected_skill))
+
+
+# Snipe mode re-polls page 0, where new listings land, every
+# SNIPE_INTERVAL_SECONDS between full cycles and alerts on tracked pet BINs
+# listed well under their day average. snipe_index maps (tier, pet, level)
+# to that listing's price threshold and pricing inputs; it is rebuilt from
+# pet_price_summary once per ingestion generation.
+SNIPE_MODE = os.environ.get("PETCALC_SNIPE_MODE") == "1"
+SNIPE_INTERVAL_SECONDS = 5
+# Listings under this fraction of their day average are snipes
+SNIPE_PRICE_RATIO = 0.8
+# Older listings have already been through a full cycle
+SNIPE_MAX_LISTING_AGE_SECONDS = 300
+SNIPE_SEEN_LIMIT = 10000
+snipe_index = {}
+snipe_index_generation = None
+snipe_last_updated = None
+# uuids already checked, oldest first
+snipe_seen = {}
+recent_snipes = deque(maxlen=50)
+
+
+def build_snipe_index(reference):
+    """Map every priced (tier, pet, level) to its snipe threshold.
+
+    A low-level listing is priced as a levelling flip sold at the high
+    level's day average, a high-level one as a resale at its own average.
+    """
+    with db_reader() as conn:
+        rows = conn.execute(
+            """
+            SELECT pet_name, rarity, level, CAST(day_sum AS REAL) / NULLIF(day_count, 0)
+            FROM pet_price_summary
+            """
+        ).fetchall()
+    day_averages = {(pet, rarity, level): day_avg for pet, rarity, level, day_avg in rows if day_avg}
+
+    index = {}
+    for (pet, rarity, level), day_avg in day_averages.items():
+        sell_price = day_averages.get((pet, rarity, "high"))
+        level_range = reference["level_ranges"].get(pet)
+        if sell_price is None or level_range is None:
+            continue
+        low_level, high_level = level_range
+        index[(rarity, pet, low_level if level == "low" else high_level)] = {
+            "threshold": day_avg * SNIPE_PRICE_RATIO,
+            "day_avg": day_avg,
+            "level": level,
+            "sell_price": sell_price,
+            "xp_required": (
+                reference["xp_required"].get(pet, XP_REQUIRED)[rarity] if level == "low" else None
+            ),
+            "skill": reference["pet_skills"].get(pet),
+        }
+    return index
+
+
+def price_snipe(key, auction, entry):
+    """Profit and coins per XP of buying a sniped listing, as in calculate_profit."""
+    tier, pet, level = key
+    price = auction["starting_bid"]
+    net_profit = calculate_net_profit(price, entry["sell_price"])
+
+    coins_per_xp = None
+    if entry["xp_required"]:
+        coins_per_xp = round(net_profit / entry["xp_required"], 2)
+    return {
+        "name": pet,
+        "rarity": tier,
+        "level": level,
+        "level_type": entry["level"],
+        "price": price,
+        "uuid": auction.get("uuid", "N/A"),
+        "day_avg": round(entry["day_avg"]),
+        "discount": round(1 - price / entry["day_avg"], 3),
+        "sell_price": round(entry["sell_price"]),
+        "profit": int(net_profit),
+        "profit_without_tax": int(entry["sell_price"] - price),
+        "coins_per_xp": coins_per_xp,
+        "skill": entry["skill"],
+    }
+
+
+def find_snipes(auctions, index, now):
+    """Return priced snipes among the listings of ``auctions`` not checked before."""
+    tracked_pets = get_reference_data()["tracked_pets"]
+    snipes = []
+    for auction in auctions:
+        uuid = auction.get("uuid")
+        if uuid is None or uuid in snipe_seen:
+            continue
+        snipe_seen[uuid] = None
+        key = auction_decoder.parse_pet_auction(auction, tracked_pets)
+        entry = index.get(key)
+        if entry is None or auction["starting_bid"] >= entry["threshold"]:
+            continue
+        start = auction.get("start")
+        if start is not None and now - start / 1000 > SNIPE_MAX_LISTING_AGE_SECONDS:
+            continue
+        snipe = price_snipe(key, auction, entry)
+        if snipe["profit"] > 0:
+            snipe["listed_at"] = start / 1000 if start is not None else None
+            snipes.append(snipe)
+
+    while len(snipe_seen) > SNIPE_SEEN_LIMIT:
+        del snipe_seen[next(iter(snipe_seen))]
+    return snipes
+
+
+def snipe_for_skill(snipe, selected_skill):
+    if snipe["coins_per_xp"] is None:
+        return {**snipe, "coins_per_xp_note": None}
+    coins_per_xp, coins_per_xp_note = adjust_for_skill(
+        snipe["coins_per_xp"], snipe["skill"], selected_skill
+    )
+    return {**snipe, "coins_per_xp": coins_per_xp, "coins_per_xp_note": coins_per_xp_note}
+
+
+async def fetch_newest_listings(tracked_pets):
+    """Page 0 reduced to its tracked pet BINs."""
+    session = await get_fetch_session()
+    return await fetch_page(
+        session,
+        0,
+        asyncio.Semaphore(1),
+        {"pages": {}},
+        partial(auction_decoder.page_pet_auctions, tracked_pets=tracked_pets),
+    )
+
+
+def poll_snipes():
+    """Check page 0 for new underpriced pet BINs and push an alert per snipe.
+
+    Alerts go to /events subscribers as "snipe" events and are kept in
+    recent_snipes, which other workers pick up from SHARED_SNIPES_PATH.
+    Detection latency runs from the listing's creation to its alert being
+    published.
+    """
+    global snipe_index, snipe_index_generation, snipe_last_updated
+    reference = get_reference_data()
+    if snipe_index_generation != ingestion_generation:
+        snipe_index = build_snipe_index(reference)
+        snipe_index_generation = ingestion_generation
+    if not snipe_index:
+        return
+
+    try:
+        data = run_coroutine(fetch_newest_listings(reference["tracked_pets"]))
+    except SnapshotError as e:
+        logging.warning(f"Snipe poll failed: {e}")
+        return
+    if data.get("lastUpdated") == snipe_last_updated:
+        return
+    snipe_last_updated = data.get("lastUpdated")
+
+    snipes = find_snipes(data["auctions"], snipe_index, time.time())
+    for snipe in snipes:
+        snipe["detected_at"] = time.time()
+        recent_snipes.append(snipe)
+        publish_snipe_event(snipe)
+        inc_counter("petcalc_snipe_alerts_total")
+        if snipe["listed_at"] is not None:
+            latency = snipe["detected_at"] - snipe["listed_at"]
+            observe("petcalc_snipe_detection_seconds", latency)
+            logging.info(
+                f"Snipe: {snipe['rarity']} [Lvl {snipe['level']}] {snipe['name']} for "
+                f"{snipe['price']} ({snipe['discount']:.0%} under its day average), "
+                f"detected {latency:.1f}s after listing"
+            )
+    if snipes and MULTI_WORKER:
+        publish_shared_snipes()
+
+
+def publish_snipe_event(snipe):
+    for skill in SKILLS:
+        publish_event(format_sse("snipe", snipe_for_skill(snipe, skill)), skill=skill)
+
+
+def list_recent_snipes(selected_skill):
+    return [snipe_for_skill(snipe, selected_skill) for snipe in reversed(recent_snipes)]
+
+
+@app.route("/snipes")
+def snipes():
+    """The most recent snipe alerts, newest first."""
+    selected_skill = request.args.get("skill", DEFAULT_SKILL)
+    return jsonify(list_recent_snipes(selected_skill))
+
+
+# /rank ranks the current prices under many what-if parameter sets at once.
+# The price matrix holds the /analyze rows as columns and is rebuilt once per
+# ingestion generation; with numpy every set is evaluated in one pass over it.
+RANK_MAX_SETS = 50
+RANK_DEFAULT_TOP = 20
+RANK_MAX_TOP = 200
+RANK_PARAMETERS = {
+    "id",
+    "skill",
+    "xp_boost",
+    "xp_required",
+    "ah_tax",
+    "claim_tax",
+    "off_skill_divisor",
+    "min_profit",
+    "budget",
+    "top",
+}
+RANK_ROW_FIELDS = (
+    "name",
+    "rarity",
+    "skill",
+    "low_price",
+    "high_price",
+    "low_uuid",
+    "high_uuid",
+)
+price_matrix = None
+
+
+def get_price_matrix():
+    global price_matrix
+    cached = get_cached_analysis(DEFAULT_SKILL)
+    matrix = price_matrix
+    if matrix is not None and matrix["etag"] == cached["etag"]:
+        return matrix
+
+    xp_required = get_reference_data()["xp_required"]
+    rows = [{field: row[field] for field in RANK_ROW_FIELDS} for row in cached["rows"]]
+    columns = {
+        "low": [row["low_price"] for row in rows],
+        "high": [row["high_price"] for row in rows],
+        "xp": [xp_required[row["name"]][row["rarity"]] for row in rows],
+        # Pets on the shared per-rarity table, which xp_required overrides
+        "standard_xp": [xp_required[row["name"]] is XP_REQUIRED for row in rows],
+        "rarity": [row["rarity"] for row in rows],
+        "skill": [row["skill"] for row in rows],
+    }
+    if np is not None:
+        columns = {
+            "low": np.array(columns["low"], dtype=float),
+            "high": np.array(columns["high"], dtype=float),
+            "xp": np.array(columns["xp"], dtype=float),
+            "standard_xp": np.array(columns["standard_xp"], dtype=bool),
+            "rarity": np.array(columns["rarity"], dtype=object),
+            "skill": np.array(columns["skill"], dtype=object),
+        }
+    matrix = {"generation": cached["generation"], "etag": cached["etag"], "rows": rows, **columns}
+    price_matrix = matrix
+    return matrix
+
+
+def check_number(value, name, minimum=None, maximum=None, nullable=False, integer=False):
+    """Return ``value`` if it is a number within the bounds; raises ValueError.
+
+    None is only accepted, and returned, when ``nullable`` is set.
+    """
+    if value is None and nullable:
+        return None
+    if integer and (isinstance(value, bool) or not isinstance(value, int)):
+        raise ValueError(f"{name} must be an integer")
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ValueError(f"{name} must be a number")
+    if minimum is not None and value < minimum:
+        raise ValueError(f"{name} must be at least {minimum}")
+    if maximum is not None and value > maximum:
+        raise ValueError(f"{name} must be at most {maximum}")
+    return value
+
+
+def parse_rank_set(values):
+    """Validate one /rank parameter set and fill in the defaults; raises ValueError."""
+    if not isinstance(values, dict):
+        raise ValueError("must be an object")
+    unknown = set(values) - RANK_PARAMETERS
+    if unknown:
+        raise ValueError(f"unknown parameter(s) {', '.join(sorted(unknown))}")
+
+    skill = values.get("skill", DEFAULT_SKILL)
+    if skill not in SKILLS:
+        raise ValueError(f"skill must be one of {', '.join(SKILLS)}")
+
+    ah_tax = values.get("ah_tax", AH_TAX_BRACKETS)
+    if not isinstance(ah_tax, (list, tuple)):
+        ah_tax = [[None, ah_tax]]
+    brackets = []
+    for bracket in ah_tax:
+        if not isinstance(bracket, (list, tuple)) or len(bracket) != 2:
+            raise ValueError("ah_tax must be a rate or a list of [upper bound, rate] brackets")
+        limit = check_number(bracket[0], "ah_tax bound", minimum=0, nullable=True)
+        rate = check_number(bracket[1], "ah_tax rate", minimum=0, maximum=1)
+        if brackets and limit is not None and limit <= brackets[-1][0]:
+            raise ValueError("ah_tax bounds must rise")
+        brackets.append([limit, rate])
+        if limit is None:
+            break
+    if not brackets or brackets[-1][0] is not None or len(brackets) != len(ah_tax):
+        raise ValueError("the last ah_tax bracket, and only that one, must have a null bound")
+
+    xp_required = values.get("xp_required", {})
+    if not isinstance(xp_required, dict) or not set(xp_required) <= set(RARITY_COLORS):
+        raise ValueError(f"xp_required must map rarities ({', '.join(RARITY_COLORS)}) to XP")
+    for rarity, xp in xp_required.items():
+        check_number(xp, f"xp_required {rarity}", minimum=1)
+
+    default_divisor = off_skill_divisor(skill)[0]
+    top = check_number(values.get("top", RANK_DEFAULT_TOP), "top", 1, RANK_MAX_TOP, integer=True)
+    return {
+        "id": values.get("id"),
+        "skill": skill,
+        "xp_boost": check_number(values.get("xp_boost", 0), "xp_boost", 0, 100),
+        "xp_required": xp_required,
+        "ah_tax": brackets,
+        "claim_tax": check_number(values.get("claim_tax", CLAIM_TAX), "claim_tax", 0, 1),
+        "off_skill_divisor": check_number(
+            values.get("off_skill_divisor", default_divisor), "off_skill_divisor", minimum=1
+        ),
+        "min_profit": check_number(values.get("min_profit"), "min_profit", nullable=True),
+        "budget": check_number(values.get("budget"), "budget", minimum=0, nullable=True),
+        "top": top,
+    }
+
+
+def parse_rank_request(payload):
+    """Validate a /rank body; returns (sets, None) or (None, (error, status))."""
+    sets = payload.get("sets") if isinstance(payload, dict) else payload
+    if not isinstance(sets, list) or not sets:
+        return None, ("sets must be a non-empty list of parameter sets", 400)
+    if len(sets) > RANK_MAX_SETS:
+        return None, (f"at most {RANK_MAX_SETS} parameter sets per request", 400)
+    parsed = []
+    for i, values in enumerate(sets):
+        try:
+            parsed.append(parse_rank_set(values))
+        except ValueError as e:
+            return None, (f"sets[{i}]: {e}", 400)
+    return parsed, None
+
+
+def rank_note(parameters):
+    """The coins_per_xp_note of an off-skill pet under a parameter set."""
+    default_divisor, note = off_skill_divisor(parameters["skill"])
+    divisor = parameters["off_skill_divisor"]
+    if divisor == 1:
+        return None
+    if divisor != default_divisor:
+        return f" /{divisor:g} because its not a {parameters['skill']} Pet"
+    return note
+
+
+def score_rank_sets(matrix, sets):
+    """Return (net profit, coins per XP, XP required, eligible) per set and row.
+
+    Uses numpy arrays of shape (sets, rows) when numpy is installed and
+    nested lists otherwise.
+    """
+    if np is None:
+        scores = []
+        for parameters in sets:
+            divisor = parameters["off_skill_divisor"]
+            profits, coins, xps, eligible = [], [], [], []
+            for i, (low, high) in enumerate(zip(matrix["low"], matrix["high"])):
+                net_profit = calculate_net_profit(
+                    low, high, parameters["ah_tax"], parameters["claim_tax"]
+                )
+                xp = matrix["xp"][i]
+                if matrix["standard_xp"][i]:
+                    xp = parameters["xp_required"].get(matrix["rarity"][i], xp)
+                xp /= 1 + parameters["xp_boost"]
+                coins_per_xp = round(net_profit / xp, 2) if xp else 0
+                if divisor != 1 and matrix["skill"][i] != parameters["skill"]:
+                    coins_per_xp /= divisor
+                profits.append(net_profit)
+                coins.append(coins_per_xp)
+                xps.append(xp)
+                eligible.append(
+                    (parameters["min_profit"] is None or net_profit >= parameters["min_profit"])
+                    and (parameters["budget"] is None or low <= parameters["budget"])
+                )
+            scores.append((profits, coins, xps, eligible))
+        return scores
+
+    low, high = matrix["low"], matrix["high"]
+    gross_profit = high - low
+
+    ah_tax = np.empty((len(sets), len(high)))
+    xp = np.empty((len(sets), len(high)))
+    divisors = np.ones((len(sets), len(high)))
+    off_skill = np.array([matrix["skill"] != parameters["skill"] for parameters in sets])
+    for s, parameters in enumerate(sets):
+        limits = [high < limit for limit, _ in parameters["ah_tax"][:-1]]
+        rates = [rate for _, rate in parameters["ah_tax"]]
+        ah_tax[s] = high * (np.select(limits, rates[:-1], rates[-1]) if limits else rates[-1])
+        xp[s] = matrix["xp"]
+        for rarity, value in parameters["xp_required"].items():
+            xp[s][matrix["standard_xp"] & (matrix["rarity"] == rarity)] = value
+        divisors[s][off_skill[s]] = parameters["off_skill_divisor"]
+
+    claim_tax = np.array([parameters["claim_tax"] for parameters in sets])[:, None]
+    xp_boost = np.array([parameters["xp_boost"] for parameters in sets])[:, None]
+    net_profit = gross_profit - ah_tax - gross_profit * claim_tax
+    xp /= 1 + xp_boost
+    coins_per_xp = np.round(np.divide(net_profit, xp, out=np.zeros_like(xp), where=xp > 0), 2)
+    coins_per_xp /= divisors
+
+    eligible = np.ones((len(sets), len(high)), dtype=bool)
+    for s, parameters in enumerate(sets):
+        if parameters["min_profit"] is not None:
+            eligible[s] &= net_profit[s] >= parameters["min_profit"]
+        if parameters["budget"] is not None:
+            eligible[s] &= low <= parameters["budget"]
+    return [
+        (net_profit[s].tolist(), coins_per_xp[s].tolist(), xp[s].tolist(), eligible[s].tolist())
+        for s in range(len(sets))
+    ]
+
+
+def rank_parameter_sets(sets):
+    """Top-N rows of the current ranking for every parameter set."""
+    matrix = get_price_matrix()
+    results = []
+    for parameters, (profits, coins, xps, eligible) in zip(
+        sets, score_rank_sets(matrix, sets)
+    ):
+        note = rank_note(parameters)
+        ranked = sorted(
+            (i for i, keep in enumerate(eligible) if keep),
+            key=lambda i: coins[i],
+            reverse=True,
+        )
+        rows = []
+        for i in ranked[: parameters["top"]]:
+            row = matrix["rows"][i]
+            low, high = row["low_price"], row["high_price"]
+            rows.append(
+                {
+                    **row,
+                    "profit": int(profits[i]),
+                    "profit_without_tax": int(high - low),
+                    "coins_per_xp": coins[i],
+                    "coins_per_xp_note": note if row["skill"] != parameters["skill"] else None,
+                    "xp_required": round(xps[i]),
+                }
+            )
+        results.append({"params": parameters, "matches": len(ranked), "rows": rows})
+    return {
+        "generation": matrix["generation"],
+        "last_update": last_update_time.isoformat() if last_update_time else None,
+        "results": results,
+    }
+
+
+@app.route("/rank", methods=["POST"])
+def rank():
+    """Rank the current prices under each posted parameter set.
+
+    The JSON body is {"sets": [...]}; every set may give skill, xp_boost
+    (0.2 for +20% XP), xp_required per rarity, ah_tax as a flat rate or
+    [[upper bound, rate], ..., [null, rate]] brackets, claim_tax,
+    off_skill_divisor, min_profit, budget (highest low-level price), top
+    and an id that is echoed back.
+    """
+    sets, error = parse_rank_request(request.get_json(silent=True))
+    if error is not None:
+        return jsonify({"error": error[0]}), error[1]
+    return encoded_json_response(encode_bodies(rank_parameter_sets(sets)))
+
+
+def get_golden_dragon_xp():
+    return get_reference_data()["golden_dragon_xp"]
+
+
+def get_average_prices_batch(pet_data):
     placeholders = ",".join(["(?,?,?)" for _ in pet_data])
     query = f"""
     SELECT pet_name, rarity, level,
-           AVG(CASE WHEN timestamp > ? THEN price ELSE NULL END) as day_avg,
-           AVG(CASE WHEN timestamp > ? THEN price ELSE NULL END) as week_avg
-    FROM pet_prices
+           CAST(day_sum AS REAL) / NULLIF(day_count, 0) as day_avg,
+           CAST(week_sum AS REAL) / NULLIF(week_count, 0) as week_avg
+    FROM pet_price_summary
     WHERE (pet_name, rarity, level) IN ({placeholders})
-    GROUP BY pet_name, rarity, level
     """
 
-    params = [day_ago, week_ago]
-    params.extend([item for sublist in pet_data for item in sublist])
+    params = [item for sublist in pet_data for item in sublist]
 
-    c.execute(query, params)
-    results = c.fetchall()
+    with db_reader() as conn:
+        results = conn.execute(query, params).fetchall()
 
-    conn.close()
     return {(row[0], row[1], row[2]): (row[3], row[4]) for row in results}
 
 
 def fetch_pet_data_from_db():
-    conn = sqlite3.connect("pet_prices.db")
-    c = conn.cursor()
-
-    c.execute(
-        """
-    WITH latest_prices AS (
+    with db_reader() as conn:
+        results = conn.execute(
+            """
         SELECT pet_name, rarity, level, price, uuid, timestamp,
-               ROW_NUMBER() OVER (PARTITION BY pet_name, rarity, level ORDER BY timestamp DESC) as rn
-        FROM pet_prices
-    )
-    SELECT lp.pet_name, lp.rarity, lp.level, 
-           lp.price as current_price, 
-           lp.uuid,
-           lp.timestamp,
-           AVG(CASE WHEN pp.timestamp > datetime('now', '-1 day') THEN pp.price END) as day_avg,
-           AVG(CASE WHEN pp.timestamp > datetime('now', '-7 day') THEN pp.price END) as week_avg
-    FROM latest_prices lp
-    JOIN pet_prices pp ON lp.pet_name = pp.pet_name AND lp.rarity = pp.rarity AND lp.level = pp.level
-    WHERE lp.rn = 1
-    GROUP BY lp.pet_name, lp.rarity, lp.level
-    """
-    )
-
-    results = c.fetchall()
-    conn.close()
+               CAST(day_sum AS REAL) / NULLIF(day_count, 0) as day_avg,
+               CAST(week_sum AS REAL) / NULLIF(week_count, 0) as week_avg
+        FROM pet_price_summary
+        """
+        ).fetchall()
 
     pet_data = {}
     for row in results:
@@ -612,6 +2746,266 @@ def fetch_pet_data_from_db():
     return pet_data
 
 
+# /history picks the finest resolution whose maximum range covers the request
+# and downsamples to at most the requested number of points with LTTB.
+HISTORY_RESOLUTIONS = {
+    "5m": (timedelta(minutes=5), timedelta(days=1)),
+    "1h": (timedelta(hours=1), timedelta(days=14)),
+    "1d": (timedelta(days=1), None),
+}
+HISTORY_DEFAULT_RANGE = "7d"
+HISTORY_DEFAULT_POINTS = 300
+HISTORY_MAX_POINTS = 2000
+HISTORY_CACHE_MAX_BUCKETS = 2000
+HISTORY_RANGE_PATTERN = re.compile(r"(\d+)([hdwy])")
+HISTORY_RANGE_UNITS = {"h": 1 / 24, "d": 1, "w": 7, "y": 365}
+
+# Finished buckets per (pet, rarity, level, resolution). Every bucket from
+# "from" up to "through" is cached; later buckets are loaded on demand and
+# kept once an ingestion cycle has moved past their end.
+history_cache = {}
+history_cache_lock = threading.Lock()
+
+
+def floor_time(timestamp, resolution):
+    if resolution == "1d":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == "1h":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=timestamp.minute - timestamp.minute % 5, second=0, microsecond=0)
+
+
+def pick_history_resolution(start, end):
+    for resolution, (_, max_range) in HISTORY_RESOLUTIONS.items():
+        if max_range is None or end - start <= max_range:
+            return resolution
+
+
+def load_history_points(pet, rarity, level, start, end):
+    """Return (time, low, sum, high, count) partial aggregates for start <= time < end.
+
+    Raw rows, hourly and daily rollups are combined; they never overlap since
+    compaction deletes what it rolls up.
+    """
+    if start >= end:
+        return []
+    points = []
+    with db_reader() as conn:
+        for table in ("pet_prices_daily", "pet_prices_hourly"):
+            points.extend(
+                (datetime.fromisoformat(bucket), low, total, high, count)
+                for bucket, low, total, high, count in conn.execute(
+                    f"""
+                SELECT bucket, low_price, price_sum, high_price, count
+                FROM {table}
+                WHERE pet_name = ? AND rarity = ? AND level = ? AND bucket >= ? AND bucket < ?
+                """,
+                    (pet, rarity, level, start, end),
+                )
+            )
+        if HISTORY_BACKEND == "intervals":
+            for covered_from, last_seen, price in conn.execute(
+                """
+            SELECT covered_from, last_seen, price
+            FROM pet_listings
+            WHERE pet_name = ? AND rarity = ? AND level = ? AND last_seen >= ? AND covered_from < ?
+            """,
+                (pet, rarity, level, start, end),
+            ):
+                points.extend(
+                    (timestamp, price, price, price, 1)
+                    for timestamp in listing_points(
+                        datetime.fromisoformat(covered_from), datetime.fromisoformat(last_seen)
+                    )
+                    if start <= timestamp < end
+                )
+        elif HISTORY_BACKEND != "columnar":
+            points.extend(
+                (datetime.fromisoformat(timestamp), price, price, price, 1)
+                for timestamp, price in conn.execute(
+                    """
+                SELECT timestamp, price
+                FROM pet_prices
+                WHERE pet_name = ? AND rarity = ? AND level = ? AND timestamp >= ? AND timestamp < ?
+                """,
+                    (pet, rarity, level, start, end),
+                )
+            )
+    if HISTORY_BACKEND == "columnar":
+        points.extend(
+            (datetime.fromtimestamp(ts), price, price, price, 1)
+            for ts, price in history_store.series_points(
+                (pet, rarity, level), start - timedelta(seconds=1), end - timedelta(seconds=1)
+            )
+        )
+    return points
+
+
+def bucket_history(points, resolution):
+    buckets = {}
+    for timestamp, low, total, high, count in points:
+        bucket_start = floor_time(timestamp, resolution)
+        bucket = buckets.get(bucket_start)
+        if bucket is None:
+            buckets[bucket_start] = (low, total, high, count)
+        else:
+            buckets[bucket_start] = (
+                min(bucket[0], low),
+                bucket[1] + total,
+                max(bucket[2], high),
+                bucket[3] + count,
+            )
+    return buckets
+
+
+def get_history_buckets(pet, rarity, level, resolution, start, end):
+    """Return {bucket_start: (low, sum, high, count)} for buckets overlapping start..end."""
+    width = HISTORY_RESOLUTIONS[resolution][0]
+    first = floor_time(start, resolution)
+    last_end = floor_time(end, resolution) + width
+    key = (pet, rarity, level, resolution)
+
+    with history_cache_lock:
+        entry = history_cache.get(key)
+        if entry is not None and entry["from"] <= first:
+            buckets = {
+                bucket_start: bucket
+                for bucket_start, bucket in entry["buckets"].items()
+                if first <= bucket_start < last_end
+            }
+            load_from = entry["through"]
+        else:
+            entry, buckets, load_from = None, {}, first
+
+    loaded = bucket_history(load_history_points(pet, rarity, level, load_from, last_end), resolution)
+    buckets.update(
+        (bucket_start, bucket) for bucket_start, bucket in loaded.items() if bucket_start >= first
+    )
+
+    # A bucket can't change once an ingestion cycle has passed its end
+    if last_update_time is None:
+        return buckets
+    finished_through = min(last_end, floor_time(last_update_time, resolution))
+    finished = {
+        bucket_start: bucket
+        for bucket_start, bucket in loaded.items()
+        if bucket_start + width <= finished_through
+    }
+    with history_cache_lock:
+        if entry is None or history_cache.get(key) is not entry:
+            entry = {"from": first, "through": first, "buckets": {}}
+            history_cache[key] = entry
+        if load_from <= entry["through"] < finished_through:
+            entry["buckets"].update(finished)
+            entry["through"] = finished_through
+        if len(entry["buckets"]) > HISTORY_CACHE_MAX_BUCKETS:
+            for oldest in sorted(entry["buckets"])[: -HISTORY_CACHE_MAX_BUCKETS]:
+                del entry["buckets"][oldest]
+            entry["from"] = oldest + width
+    return buckets
+
+
+def largest_triangle_three_buckets(points, threshold):
+    """Downsample (x, min, avg, max, count) points to ``threshold`` keeping the shape of avg."""
+    if threshold >= len(points) or threshold < 3:
+        return points
+    sampled = [points[0]]
+    every = (len(points) - 2) / (threshold - 2)
+    selected = 0
+    for i in range(threshold - 2):
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, len(points))
+        next_points = points[next_start:next_end]
+        avg_x = sum(point[0] for point in next_points) / len(next_points)
+        avg_y = sum(point[2] for point in next_points) / len(next_points)
+
+        ax, ay = points[selected][0], points[selected][2]
+        max_area = -1
+        for j in range(int(i * every) + 1, next_start):
+            area = abs(
+                (ax - avg_x) * (points[j][2] - ay) - (ax - points[j][0]) * (avg_y - ay)
+            )
+            if area > max_area:
+                max_area, chosen = area, j
+        sampled.append(points[chosen])
+        selected = chosen
+    sampled.append(points[-1])
+    return sampled
+
+
+def get_price_history(pet, rarity, levels, start, end, resolution, max_points):
+    history = {}
+    for level in levels:
+        buckets = get_history_buckets(pet, rarity, level, resolution, start, end)
+        points = [
+            (bucket_start.timestamp(), low, total / count, high, count)
+            for bucket_start, (low, total, high, count) in sorted(buckets.items())
+        ]
+        history[level] = [
+            {
+                "t": datetime.fromtimestamp(x).isoformat(),
+                "min": low,
+                "avg": round(avg, 2),
+                "max": high,
+                "count": count,
+            }
+            for x, low, avg, high, count in largest_triangle_three_buckets(points, max_points)
+        ]
+    return {
+        "pet": pet,
+        "rarity": rarity,
+        "resolution": resolution,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "levels": history,
+    }
+
+
+def parse_history_request(pet, rarity, values):
+    """Validate /history arguments; returns (arguments, None) or (None, (error, status))."""
+    if pet not in get_reference_data()["pet_skills"]:
+        return None, ("Unknown pet", 404)
+    rarity = rarity.upper()
+    if rarity not in RARITY_COLORS:
+        return None, (f"rarity must be one of {', '.join(RARITY_COLORS)}", 400)
+
+    level = values.get("level")
+    if level not in (None, "low", "high"):
+        return None, ("level must be low or high", 400)
+    levels = [level] if level else ["low", "high"]
+
+    try:
+        end = datetime.fromisoformat(values["end"]) if values.get("end") else datetime.now()
+        if values.get("start"):
+            start = datetime.fromisoformat(values["start"])
+        else:
+            match = HISTORY_RANGE_PATTERN.fullmatch(values.get("range", HISTORY_DEFAULT_RANGE))
+            if match is None:
+                return None, ("range must look like 6h, 7d, 4w or 1y", 400)
+            start = end - timedelta(
+                days=int(match.group(1)) * HISTORY_RANGE_UNITS[match.group(2)]
+            )
+        max_points = int(values.get("points", HISTORY_DEFAULT_POINTS))
+    except ValueError as e:
+        return None, (str(e), 400)
+    if start >= end:
+        return None, ("start must be before end", 400)
+    max_points = max(3, min(max_points, HISTORY_MAX_POINTS))
+
+    resolution = values.get("resolution") or pick_history_resolution(start, end)
+    if resolution not in HISTORY_RESOLUTIONS:
+        return None, (f"resolution must be one of {', '.join(HISTORY_RESOLUTIONS)}", 400)
+    return (pet, rarity, levels, start, end, resolution, max_points), None
+
+
+@app.route("/history/<pet>/<rarity>")
+def price_history(pet, rarity):
+    arguments, error = parse_history_request(pet, rarity, request.args)
+    if error is not None:
+        return jsonify({"error": error[0]}), error[1]
+    return encoded_json_response(encode_bodies(get_price_history(*arguments)))
+
+
 @app.route("/last_update_time")
 def get_last_update_time():
     global last_update_time
@@ -621,96 +3015,224 @@ def get_last_update_time():
 
 
 def update_pet_prices():
-    global last_update_time
+    global last_update_time, ingestion_generation, best_level_pairs
     print("Starting update_pet_prices")
     try:
-        pet_list = load_pet_list("petlist.json")
-        print("Pet list loaded")
-        total_auctions = asyncio.run(fetch_auctions())
-        print(f"Fetched {len(total_auctions)} auctions")
-
-        auctions_by_category = defaultdict(list)
-        for auction in total_auctions:
-            if not auction.get("bin"):
-                continue
-            tier = auction.get("tier")
-            item_name = auction.get("item_name")
-            auctions_by_category[(tier, item_name)].append(auction)
-
-        print(f"Categorized {len(auctions_by_category)} auction types")
-
-        conn = sqlite3.connect("pet_prices.db")
-        c = conn.cursor()
-
-        for category in pet_list:
-            for key, pets in category.items():
-                for tier in RARITY_COLORS.keys():
-                    for pet in pets:
-                        if pet == "Golden Dragon":
-                            low_lvl, high_lvl = (
-                                "[Lvl 102] Golden Dragon",
-                                "[Lvl 200] Golden Dragon",
-                            )
-                        else:
-                            low_lvl, high_lvl = f"[Lvl 1] {pet}", f"[Lvl 100] {pet}"
+        reference = get_reference_data()
+        tracked_pets = reference["tracked_pets"]
+        with stage_timer("fetch"):
+            if INCREMENTAL_UPDATES:
+                min_auctions = run_coroutine(refresh_price_book(tracked_pets))
+            else:
+                min_auctions = {}
+                auction_count, _ = run_coroutine(
+                    fetch_auctions(
+                        lambda minimums: auction_decoder.merge_minimums(minimums, min_auctions),
+                        page_reducer=partial(
+                            auction_decoder.page_minimums, tracked_pets=tracked_pets
+                        ),
+                    )
+                )
+                print(f"Fetched {auction_count} auctions")
+        logging.debug(f"Kept minimums for {len(min_auctions)} pet listings")
+
+        with stage_timer("level_pairs"):
+            best_level_pairs = find_best_level_pairs(min_auctions, reference)
 
-                        low_pet = find_min_auction(
-                            auctions_by_category.get((tier, low_lvl), [])
+        # Every row of a cycle shares one snapshot timestamp
+        snapshot_time = datetime.now()
+        rows = []
+        for pet, (low_level, high_level) in reference["level_ranges"].items():
+            for tier in RARITY_COLORS.keys():
+                low_pet = min_auctions.get((tier, pet, low_level))
+                high_pet = min_auctions.get((tier, pet, high_level))
+
+                if low_pet:
+                    rows.append(
+                        (
+                            pet,
+                            tier,
+                            "low",
+                            low_pet["starting_bid"],
+                            snapshot_time,
+                            low_pet.get("uuid", "N/A"),
                         )
-                        high_pet = find_min_auction(
-                            auctions_by_category.get((tier, high_lvl), [])
+                    )
+                if high_pet:
+                    rows.append(
+                        (
+                            pet,
+                            tier,
+                            "high",
+                            high_pet["starting_bid"],
+                            snapshot_time,
+                            high_pet.get("uuid", "N/A"),
                         )
+                    )
 
-                        if low_pet:
-                            c.execute(
-                                "INSERT INTO pet_prices VALUES (?, ?, ?, ?, ?, ?)",
-                                (
-                                    pet,
-                                    tier,
-                                    "low",
-                                    low_pet["starting_bid"],
-                                    datetime.now(),
-                                    low_pet.get("uuid", "N/A"),
-                                ),
-                            )
-                        if high_pet:
-                            c.execute(
-                                "INSERT INTO pet_prices VALUES (?, ?, ?, ?, ?, ?)",
-                                (
-                                    pet,
-                                    tier,
-                                    "high",
-                                    high_pet["starting_bid"],
-                                    datetime.now(),
-                                    high_pet.get("uuid", "N/A"),
-                                ),
-                            )
-
-        conn.commit()
-        conn.close()
-        last_update_time = datetime.now()
-        print("Pet prices updated successfully")
+        with stage_timer("write"):
+            write_pet_prices(rows, snapshot_time)
+        last_update_time = snapshot_time
+        ingestion_generation += 1
+        print(f"Pet prices updated successfully ({len(rows)} rows)")
+        with stage_timer("cache_warm"):
+            warm_analysis_cache()
+        if MULTI_WORKER:
+            publish_shared_results()
+        with stage_timer("publish"):
+            publish_ranking_updates()
+        inc_counter("petcalc_ingest_cycles_total", result="success")
+        set_gauge("petcalc_ingest_last_success_timestamp_seconds", time.time())
         return True
     except Exception as e:
         logging.error(f"Error in update_pet_prices: {str(e)}")
+        inc_counter("petcalc_ingest_cycles_total", result="failure")
         return False
 
 def find_min_auction(auctions):
     return min(
-        (a for a in auctions if "Tier Boost" not in a.get("item_lore", "")),
+        (a for a in auctions if not auction_decoder.is_tier_boosted(a)),
         key=lambda x: x["starting_bid"],
         default=None,
     )
 
+MIN_REFRESH_INTERVAL_SECONDS = 60
+
+# Ingestion cycles only ever run on this single worker. update_jobs keeps the
+# most recent jobs by id so clients can poll their status.
+update_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingest")
+update_jobs = {}
+update_jobs_lock = threading.Lock()
+current_update_job = None
+MAX_TRACKED_UPDATE_JOBS = 20
+
+
+def submit_update(force=False):
+    """Start an ingestion cycle, or attach to the one already in flight.
+
+    Without ``force`` a new cycle isn't started within
+    MIN_REFRESH_INTERVAL_SECONDS of the last successful update; None is
+    returned instead.
+    """
+    if MULTI_WORKER and not try_become_leader():
+        return request_leader_update()
+
+    with update_jobs_lock:
+        job = current_update_job
+        if job is not None and not job["future"].done():
+            return job
+
+        if (
+            not force
+            and last_update_time is not None
+            and (datetime.now() - last_update_time).total_seconds()
+            < MIN_REFRESH_INTERVAL_SECONDS
+        ):
+            return None
+
+        job = new_update_job()
+        job["future"] = update_executor.submit(run_update_job, job)
+        track_update_job(job)
+        return job
+
+
+def new_update_job():
+    # The id starts with the request time so any worker can report on it
+    started = datetime.now()
+    job_id = f"{started.strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+    return {"id": job_id, "started": started, "finished": None}
+
+
+def track_update_job(job):
+    global current_update_job
+    update_jobs[job["id"]] = job
+    while len(update_jobs) > MAX_TRACKED_UPDATE_JOBS:
+        update_jobs.pop(next(iter(update_jobs)))
+    current_update_job = job
+
+
+def run_update_job(job):
+    global profile_cycles_remaining
+    try:
+        if profile_cycles_remaining > 0:
+            profile_cycles_remaining -= 1
+            return run_profiled(update_pet_prices)
+        return update_pet_prices()
+    finally:
+        job["finished"] = datetime.now()
+
+
+def scheduled_update():
+    """Scheduler entry point; shares the single-flight job with /trigger_update."""
+    return submit_update(force=True)["future"].result()
+
+
+def describe_update_job(job):
+    future = job["future"]
+    if not future.done():
+        status = "running"
+    elif future.result():
+        status = "succeeded"
+    else:
+        status = "failed"
+    return {
+        "job_id": job["id"],
+        "status": status,
+        "started": job["started"].isoformat(),
+        "finished": job["finished"].isoformat() if job["finished"] else None,
+        "last_update_time": last_update_time.isoformat() if last_update_time else None,
+    }
+
+
 @app.route("/trigger_update", methods=["POST"])
 def trigger_update():
-    success = update_pet_prices()
-    return jsonify({"success": success, "last_update_time": last_update_time.isoformat() if last_update_time else None})
+    job = submit_update()
+    if job is None:
+        response = jsonify(
+            {
+                "error": "Prices were updated recently",
+                "last_update_time": last_update_time.isoformat() if last_update_time else None,
+            }
+        )
+        response.status_code = 429
+        response.headers["Retry-After"] = str(MIN_REFRESH_INTERVAL_SECONDS)
+        return response
+
+    status_url = url_for("update_status", job_id=job["id"])
+    response = jsonify({**describe_update_job(job), "status_url": status_url})
+    response.status_code = 202
+    response.headers["Location"] = status_url
+    return response
+
+
+@app.route("/update_status/<job_id>")
+def update_status(job_id):
+    job = find_update_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(describe_update_job(job))
+
+
+def find_update_job(job_id):
+    """Look up a job, including in multi-worker mode one started by another worker."""
+    job = update_jobs.get(job_id)
+    if job is not None or not MULTI_WORKER:
+        return job
+    try:
+        started = datetime.strptime(job_id.split("-")[0], "%Y%m%dT%H%M%S%f")
+    except ValueError:
+        return None
+    job = {"id": job_id, "started": started, "finished": None, "future": Future()}
+    resolve_leader_update(job)
+    return job
 
 
 @app.route("/test_timer")
 def test_timer():
-    global last_update_time
+    return jsonify(get_timer_status())
+
+
+def get_timer_status():
     current_time = datetime.now()
 
     if not last_update_time:
@@ -721,26 +3243,329 @@ def test_timer():
         minutes_until_next_update = 5 - (minutes_since_last_update % 5)
         next_update = current_time + timedelta(minutes=minutes_until_next_update)
 
-    return jsonify({
+    return {
         "current_time": current_time.isoformat(),
         "last_update": last_update_time.isoformat() if last_update_time else None,
         "next_update": next_update.isoformat(),
         "seconds_until_next_update": (next_update - current_time).total_seconds()
-    })
+    }
+
+
+# Multi-worker mode, for several server processes (e.g. gunicorn workers) on
+# one host. Only the process holding the LEADER_LOCK_PATH file lock runs the
+# scheduled ingestion and compaction; after every cycle it publishes the
+# pre-encoded rankings, level pairs and update time to SHARED_RESULTS_PATH.
+# The other workers map that file when it changes and serve from it without
+# touching the database. Snipe alerts, which the leader polls for, go through
+# SHARED_SNIPES_PATH the same way and followers push the new ones to their
+# own /events subscribers. Followers retry the lock on every poll, so one of
+# them takes over within SHARED_RESULTS_POLL_SECONDS if the leader exits.
+MULTI_WORKER = os.environ.get("PETCALC_MULTI_WORKER") == "1"
+LEADER_LOCK_PATH = "petcalc.leader.lock"
+SHARED_RESULTS_PATH = "petcalc.results"
+SHARED_SNIPES_PATH = "petcalc.snipes"
+REFRESH_REQUEST_PATH = "petcalc.refresh"
+SHARED_RESULTS_MAGIC = b"PETRES01"
+SHARED_RESULTS_POLL_SECONDS = 2
+# A follower's /trigger_update request is reported failed if the leader
+# hasn't published newer results within this time
+LEADER_UPDATE_TIMEOUT_SECONDS = 300
+
+leader_lock_file = None
+shared_results_lock = threading.Lock()
+shared_results_signature = None
+shared_snipes_signature = None
+handled_refresh_request = None
+
+
+def try_become_leader():
+    """Return True if this process is, or just became, the ingestion leader."""
+    global leader_lock_file
+    if not MULTI_WORKER or fcntl is None or leader_lock_file is not None:
+        return True
+    lock_file = open(LEADER_LOCK_PATH, "a+")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    lock_file.seek(0)
+    lock_file.truncate()
+    lock_file.write(f"{os.getpid()}\n")
+    lock_file.flush()
+    leader_lock_file = lock_file
+    logging.info(f"Worker {os.getpid()} is now the ingestion leader")
+    return True
+
+
+def leader_only(func):
+    """Wrap a scheduled job so it only runs on the ingestion leader."""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not try_become_leader():
+            return None
+        return func(*args, **kwargs)
+
+    return wrapper
+
+
+def publish_shared_results():
+    """Leader side: write this generation's results for the other workers.
+
+    The file is an 8 byte magic, an 8 byte index length, a JSON index and the
+    blobs the index points at as [offset, length]. It is replaced atomically,
+    so readers that still map the previous file keep a consistent copy.
+    """
+    blobs = bytearray()
+
+    def add_blob(data):
+        blobs.extend(data)
+        return [len(blobs) - len(data), len(data)]
+
+    index = {
+        "last_update_time": last_update_time.isoformat() if last_update_time else None,
+        "skills": {},
+        "level_pairs": add_blob(encode_json(list(best_level_pairs.values()))),
+    }
+    for skill, cached in list(analysis_cache.items()):
+        if cached["generation"] != ingestion_generation:
+            continue
+        index["skills"][skill] = {
+            "expires": cached["expires"].isoformat() if cached["expires"] else None,
+            "etags": cached["etags"],
+            "bodies": {
+                response_format: {
+                    encoding: add_blob(body) for encoding, body in bodies.items()
+                }
+                for response_format, bodies in cached["bodies"].items()
+            },
+        }
+
+    index_bytes = encode_json(index)
+    temp_path = f"{SHARED_RESULTS_PATH}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(SHARED_RESULTS_MAGIC)
+        f.write(len(index_bytes).to_bytes(8, "little"))
+        f.write(index_bytes)
+        f.write(blobs)
+    os.replace(temp_path, SHARED_RESULTS_PATH)
+
+
+def sync_shared_results():
+    """Follower side: adopt the leader's results if the shared file changed.
+
+    Returns True if new results were loaded.
+    """
+    global shared_results_signature, ingestion_generation, last_update_time, best_level_pairs
+    try:
+        stat = os.stat(SHARED_RESULTS_PATH)
+    except FileNotFoundError:
+        return False
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if signature == shared_results_signature:
+        return False
 
-if not hasattr(app, "scheduler"):
-    app.scheduler = BackgroundScheduler()
-    app.scheduler.add_job(func=update_pet_prices, trigger="interval", minutes=5)
+    with shared_results_lock:
+        if signature == shared_results_signature:
+            return False
+        with open(SHARED_RESULTS_PATH, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with mapped:
+            if mapped[:8] != SHARED_RESULTS_MAGIC:
+                logging.error(f"{SHARED_RESULTS_PATH} is not a results file")
+                return False
+            index_length = int.from_bytes(mapped[8:16], "little")
+            index = json.loads(mapped[16 : 16 + index_length])
+            base = 16 + index_length
+
+            def read_blob(location):
+                offset, length = location
+                return mapped[base + offset : base + offset + length]
+
+            generation = ingestion_generation + 1
+            for skill, entry in index["skills"].items():
+                bodies = {
+                    response_format: {
+                        encoding: read_blob(location) for encoding, location in encodings.items()
+                    }
+                    for response_format, encodings in entry["bodies"].items()
+                }
+                analysis_cache[skill] = {
+                    "generation": generation,
+                    "expires": entry["expires"] and datetime.fromisoformat(entry["expires"]),
+                    "rows": json.loads(bodies["rows"]["identity"]),
+                    "bodies": bodies,
+                    "etags": entry["etags"],
+                    "etag": entry["etags"]["rows"],
+                }
+            best_level_pairs = {
+                (row["name"], row["rarity"]): row
+                for row in json.loads(read_blob(index["level_pairs"]))
+            }
+        if index["last_update_time"]:
+            last_update_time = datetime.fromisoformat(index["last_update_time"])
+        ingestion_generation = generation
+        shared_results_signature = signature
+
+    publish_ranking_updates()
+    return True
+
+
+def publish_shared_snipes():
+    """Leader side: write recent_snipes for the other workers."""
+    temp_path = f"{SHARED_SNIPES_PATH}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(encode_json(list(recent_snipes)))
+    os.replace(temp_path, SHARED_SNIPES_PATH)
+
+
+def sync_shared_snipes():
+    """Follower side: adopt and push the snipes the leader found since the last sync."""
+    global shared_snipes_signature
+    try:
+        stat = os.stat(SHARED_SNIPES_PATH)
+    except FileNotFoundError:
+        return
+    signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if signature == shared_snipes_signature:
+        return
+
+    with shared_results_lock:
+        if signature == shared_snipes_signature:
+            return
+        with open(SHARED_SNIPES_PATH, "rb") as f:
+            shared = json.loads(f.read())
+        latest = recent_snipes[-1]["detected_at"] if recent_snipes else 0
+        new_snipes = [snipe for snipe in shared if snipe["detected_at"] > latest]
+        recent_snipes.extend(new_snipes)
+        shared_snipes_signature = signature
+    for snipe in new_snipes:
+        publish_snipe_event(snipe)
+
+
+def request_leader_update():
+    """Follower side of /trigger_update: ask the leader for a cycle.
+
+    Returns a job that resolves once newer results are published, or None if
+    prices were updated within MIN_REFRESH_INTERVAL_SECONDS.
+    """
+    sync_shared_results()
+    with update_jobs_lock:
+        job = current_update_job
+        if job is not None and not job["future"].done():
+            return job
+        if (
+            last_update_time is not None
+            and (datetime.now() - last_update_time).total_seconds()
+            < MIN_REFRESH_INTERVAL_SECONDS
+        ):
+            return None
+
+        job = new_update_job()
+        job["future"] = Future()
+        with open(REFRESH_REQUEST_PATH, "w") as f:
+            f.write(f"{job['id']}\n")
+        track_update_job(job)
+        return job
+
+
+def resolve_leader_update(job):
+    if job["future"].done():
+        return
+    now = datetime.now()
+    if last_update_time is not None and last_update_time >= job["started"]:
+        job["finished"] = now
+        job["future"].set_result(True)
+    elif (now - job["started"]).total_seconds() > LEADER_UPDATE_TIMEOUT_SECONDS:
+        job["finished"] = now
+        job["future"].set_result(False)
+
+
+def poll_shared_state():
+    """Runs every SHARED_RESULTS_POLL_SECONDS in every worker.
+
+    The leader starts a cycle when a follower asked for one; followers pick
+    up new results and settle the update jobs they handed to the leader.
+    """
+    global handled_refresh_request
+    if try_become_leader():
+        try:
+            requested = os.stat(REFRESH_REQUEST_PATH).st_mtime_ns
+        except FileNotFoundError:
+            return
+        # Requests older than the last update were already served, e.g. by
+        # a previous leader
+        fresh = last_update_time is None or requested > last_update_time.timestamp() * 1e9
+        if requested != handled_refresh_request and fresh:
+            submit_update()
+        handled_refresh_request = requested
+        return
+
+    sync_shared_results()
+    sync_shared_snipes()
+    for job in list(update_jobs.values()):
+        resolve_leader_update(job)
+
+
+@app.before_request
+def sync_before_request():
+    if MULTI_WORKER and leader_lock_file is None:
+        sync_shared_results()
+        sync_shared_snipes()
+
+
+def schedule_jobs(scheduler, **update_job_kwargs):
+    scheduler.add_job(
+        func=leader_only(scheduled_update), trigger="interval", minutes=5, **update_job_kwargs
+    )
+    scheduler.add_job(func=leader_only(compact_history), trigger="interval", hours=1)
+    if MULTI_WORKER:
+        scheduler.add_job(
+            func=poll_shared_state, trigger="interval", seconds=SHARED_RESULTS_POLL_SECONDS
+        )
+    if SNIPE_MODE:
+        scheduler.add_job(
+            func=leader_only(poll_snipes), trigger="interval", seconds=SNIPE_INTERVAL_SECONDS
+        )
+    if INCREMENTAL_UPDATES:
+        scheduler.add_job(
+            func=leader_only(poll_ended_auctions), trigger="interval", seconds=ENDED_POLL_SECONDS
+        )
+    if MULTI_WORKER or SNIPE_MODE or INCREMENTAL_UPDATES:
+        # Don't log every run of the poll jobs
+        logging.getLogger("apscheduler.executors.default").setLevel(logging.WARNING)
+    return scheduler
+
+
+def is_main_process():
+    """False in a multiprocessing child, e.g. a parse worker importing the main module.
+
+    parent_process() isn't set yet while a spawned child imports the main
+    module, but the child's process name already is.
+    """
+    return multiprocessing.current_process().name == "MainProcess"
+
+
+# WSGI servers such as gunicorn only import this module, so the schema,
+# migrations and state are set up here rather than under __main__. The async
+# server does the same in its on_startup.
+if (
+    not hasattr(app, "scheduler")
+    and os.environ.get("PETCALC_SERVER") != "async"
+    and is_main_process()
+):
+    initialize_app()
+    app.scheduler = schedule_jobs(BackgroundScheduler())
     app.scheduler.start()
     atexit.register(lambda: app.scheduler.shutdown())
 
 if __name__ == "__main__":
-    initialize_app()
-
     if not hasattr(app, "scheduler"):
         app.scheduler = BackgroundScheduler()
         app.scheduler.add_job(func=update_pet_prices_wrapper, trigger="interval", minutes=5,
                               next_run_time=datetime.now())
+        app.scheduler.add_job(func=compact_history, trigger="interval", hours=1)
         app.scheduler.add_listener(job_listener, EVENT_JOB_EXECUTED | EVENT_JOB_ERROR)
         app.scheduler.start()
         atexit.register(lambda: app.scheduler.shutdown())
@@ -0,0 +1,311 @@
+"""Async serving mode on aiohttp's web server.
+
+Everything runs on one long-lived event loop: the HTTP handlers, the auction
+fetches and the shared aiohttp session, and the APScheduler jobs. Blocking
+work (SQLite reads, ingestion cycles) is pushed to a thread pool so it never
+stalls the loop. The JSON API matches the Flask app in app.py.
+
+    python async_server.py --port 8000
+"""
+import argparse
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from aiohttp import web
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+os.environ["PETCALC_SERVER"] = "async"
+
+import app as petcalc  # noqa: E402
+
+DB_THREADS = 8
+
+executor_key = web.AppKey("executor", ThreadPoolExecutor)
+scheduler_key = web.AppKey("scheduler", AsyncIOScheduler)
+index_key = web.AppKey("index_html", str)
+
+
+async def run_blocking(request, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app[executor_key], func, *args)
+
+
+async def request_values(request):
+    values = dict(request.query)
+    if request.method == "POST":
+        values.update(await request.post())
+    return values
+
+
+async def index(request):
+    return web.Response(text=request.app[index_key], content_type="text/html")
+
+
+def encoded_response(request, bodies, etag=None):
+    encoding = petcalc.choose_encoding(request.headers.get("Accept-Encoding"), bodies)
+    headers = {"Vary": "Accept-Encoding"}
+    if etag is not None:
+        headers.update({"ETag": f'"{etag}"', "Cache-Control": "no-cache"})
+        if any(tag.value == etag for tag in request.if_none_match or ()):
+            return web.Response(status=304, headers=headers)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return web.Response(
+        body=bodies[encoding], content_type="application/json", headers=headers
+    )
+
+
+def response_format_error(values):
+    if values.get("format", "rows") in petcalc.RESPONSE_FORMATS:
+        return None
+    return web.json_response(
+        {"error": f"format must be one of {', '.join(petcalc.RESPONSE_FORMATS)}"},
+        status=400,
+    )
+
+
+async def analyze_auctions(request):
+    values = await request_values(request)
+    selected_skill = values.get("skill", petcalc.DEFAULT_SKILL)
+    response_format = values.get("format", "rows")
+    error = response_format_error(values)
+    if error is not None:
+        return error
+    if selected_skill not in petcalc.SKILLS:
+        output_list = await run_blocking(
+            request, petcalc.fetch_and_analyze_auctions, selected_skill
+        )
+        return encoded_response(
+            request,
+            petcalc.encode_bodies(petcalc.shape_response(output_list, response_format)),
+        )
+
+    cached = petcalc.analysis_cache.get(selected_skill)
+    if cached is None or cached["generation"] != petcalc.ingestion_generation:
+        cached = await run_blocking(request, petcalc.get_cached_analysis, selected_skill)
+    else:
+        petcalc.inc_counter("petcalc_analyze_cache_requests_total", result="hit")
+    return encoded_response(
+        request, cached["bodies"][response_format], cached["etags"][response_format]
+    )
+
+
+async def search_pet(request):
+    values = await request_values(request)
+    error = response_format_error(values)
+    if error is not None:
+        return error
+    output_list = await run_blocking(
+        request,
+        petcalc.search_pets,
+        values.get("search_term", "").strip(),
+        values.get("skill", petcalc.DEFAULT_SKILL),
+    )
+    return encoded_response(
+        request,
+        petcalc.encode_bodies(petcalc.shape_response(output_list, values.get("format", "rows"))),
+    )
+
+
+async def level_pairs(request):
+    selected_skill = request.query.get("skill", petcalc.DEFAULT_SKILL)
+    return web.json_response(petcalc.rank_level_pairs(selected_skill))
+
+
+async def snipes(request):
+    selected_skill = request.query.get("skill", petcalc.DEFAULT_SKILL)
+    return web.json_response(petcalc.list_recent_snipes(selected_skill))
+
+
+async def rank(request):
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = None
+    sets, error = petcalc.parse_rank_request(payload)
+    if error is not None:
+        return web.json_response({"error": error[0]}, status=error[1])
+    result = await run_blocking(request, petcalc.rank_parameter_sets, sets)
+    return encoded_response(request, petcalc.encode_bodies(result))
+
+
+async def price_history(request):
+    arguments, error = await run_blocking(
+        request,
+        petcalc.parse_history_request,
+        request.match_info["pet"],
+        request.match_info["rarity"],
+        request.query,
+    )
+    if error is not None:
+        return web.json_response({"error": error[0]}, status=error[1])
+    history = await run_blocking(request, petcalc.get_price_history, *arguments)
+    return encoded_response(request, petcalc.encode_bodies(history))
+
+
+async def last_update(request):
+    last_update_time = petcalc.last_update_time
+    return web.json_response(
+        {"last_update": last_update_time.isoformat() if last_update_time else None}
+    )
+
+
+async def test_timer(request):
+    return web.json_response(petcalc.get_timer_status())
+
+
+async def trigger_update(request):
+    job = petcalc.submit_update()
+    if job is None:
+        last_update_time = petcalc.last_update_time
+        return web.json_response(
+            {
+                "error": "Prices were updated recently",
+                "last_update_time": last_update_time.isoformat() if last_update_time else None,
+            },
+            status=429,
+            headers={"Retry-After": str(petcalc.MIN_REFRESH_INTERVAL_SECONDS)},
+        )
+
+    status_url = f"/update_status/{job['id']}"
+    return web.json_response(
+        {**petcalc.describe_update_job(job), "status_url": status_url},
+        status=202,
+        headers={"Location": status_url},
+    )
+
+
+async def update_status(request):
+    job = petcalc.find_update_job(request.match_info["job_id"])
+    if job is None:
+        return web.json_response({"error": "Unknown job"}, status=404)
+    return web.json_response(petcalc.describe_update_job(job))
+
+
+async def events(request):
+    skill = request.query.get("skill", petcalc.DEFAULT_SKILL)
+    response = web.StreamResponse(
+        headers={
+            "Content-Type": "text/event-stream",
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+        }
+    )
+    await response.prepare(request)
+
+    loop = asyncio.get_running_loop()
+    messages = asyncio.Queue(maxsize=100)
+
+    def deliver(message):
+        if messages.full():
+            raise asyncio.QueueFull
+        loop.call_soon_threadsafe(messages.put_nowait, message)
+
+    token = petcalc.subscribe_events(skill, deliver)
+    deadline = loop.time() + petcalc.SSE_MAX_STREAM_SECONDS
+    try:
+        await response.write(
+            petcalc.format_sse("countdown", petcalc.get_timer_status()).encode()
+        )
+        while petcalc.is_subscribed(token) and loop.time() < deadline:
+            try:
+                message = await asyncio.wait_for(
+                    messages.get(), petcalc.SSE_KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                message = ": keepalive\n\n"
+            await response.write(message.encode())
+    except ConnectionResetError:
+        pass
+    finally:
+        petcalc.unsubscribe_events(token)
+    return response
+
+
+async def metrics(request):
+    body = await run_blocking(request, petcalc.render_metrics)
+    return web.Response(
+        text=body, headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+
+async def profile_cycles(request):
+    values = await request_values(request)
+    try:
+        cycles = int(values.get("cycles", 1))
+    except ValueError:
+        return web.json_response({"error": "cycles must be an integer"}, status=400)
+    return web.json_response(petcalc.request_profile(cycles))
+
+
+async def favicon(request):
+    return web.FileResponse(os.path.join(petcalc.app.root_path, "static", "favicon.ico"))
+
+
+def render_index():
+    with petcalc.app.test_request_context("/"):
+        return petcalc.render_template("index.html")
+
+
+def create_app(ingest=True):
+    web_app = web.Application()
+    web_app[index_key] = render_index()
+
+    async def on_startup(web_app):
+        loop = asyncio.get_running_loop()
+        petcalc.use_event_loop(loop)
+        web_app[executor_key] = ThreadPoolExecutor(DB_THREADS, thread_name_prefix="db")
+        await loop.run_in_executor(web_app[executor_key], petcalc.initialize_app)
+
+        scheduler = AsyncIOScheduler(event_loop=loop)
+        if ingest:
+            petcalc.schedule_jobs(scheduler, next_run_time=datetime.now())
+        scheduler.start()
+        web_app[scheduler_key] = scheduler
+
+    async def on_cleanup(web_app):
+        web_app[scheduler_key].shutdown(wait=False)
+        await petcalc.close_fetch_session()
+        web_app[executor_key].shutdown(wait=False)
+
+    web_app.on_startup.append(on_startup)
+    web_app.on_cleanup.append(on_cleanup)
+
+    web_app.router.add_get("/", index)
+    web_app.router.add_get("/favicon.ico", favicon)
+    web_app.router.add_route("GET", "/analyze", analyze_auctions)
+    web_app.router.add_route("POST", "/analyze", analyze_auctions)
+    web_app.router.add_post("/search", search_pet)
+    web_app.router.add_get("/level_pairs", level_pairs)
+    web_app.router.add_get("/snipes", snipes)
+    web_app.router.add_post("/rank", rank)
+    web_app.router.add_get("/history/{pet}/{rarity}", price_history)
+    web_app.router.add_get("/last_update_time", last_update)
+    web_app.router.add_get("/test_timer", test_timer)
+    web_app.router.add_post("/trigger_update", trigger_update)
+    web_app.router.add_get("/update_status/{job_id}", update_status)
+    web_app.router.add_get("/events", events)
+    web_app.router.add_get("/metrics", metrics)
+    web_app.router.add_post("/metrics/profile", profile_cycles)
+    web_app.router.add_static("/static", os.path.join(petcalc.app.root_path, "static"))
+    web_app.router.add_static(
+        "/images/pets", os.path.join(petcalc.app.root_path, "images", "pets")
+    )
+    return web_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run PetCalculator in async serving mode")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument(
+        "--no-ingest", action="store_true", help="serve only, don't schedule ingestion"
+    )
+    args = parser.parse_args()
+    web.run_app(create_app(ingest=not args.no_ingest), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Decoding and reduction of raw auction pages.
+
+Every decoder returns the page as a dict with ``page``, ``totalPages``,
+``lastUpdated`` and ``auctions``. Each auction is reduced to:
+
+    {"uuid", "bin", "tier", "item_name", "starting_bid", "start", "end", "tier_boost"}
+
+``tier_boost`` takes the place of the lore text. Fields such as
+``item_bytes``, ``bids`` and ``item_lore`` are never kept.
+
+- msgspec: a typed decoder that skips unknown fields without allocating them.
+- orjson: a fast full parse that is then projected.
+- json: the stdlib parser, projecting each auction as soon as it is parsed.
+- full: the plain ``json.loads`` used before, kept for comparison.
+
+``auto`` picks the first installed of msgspec, orjson and json.
+
+``parse_page`` decodes a page and reduces it to what a cycle keeps, such as
+``page_minimums``. Nothing here touches app state, so the parse pool's
+worker processes import only this module.
+"""
+import json
+import re
+import time
+
+try:
+    import msgspec
+except ImportError:  # optional, see DECODERS
+    msgspec = None
+try:
+    import orjson
+except ImportError:  # optional, see DECODERS
+    orjson = None
+
+AUCTION_FIELDS = ("uuid", "bin", "tier", "item_name", "starting_bid", "start", "end")
+TIER_BOOST_MARKER = "Tier Boost"
+
+# Pet listings are named "[Lvl N] Pet Name"
+PET_ITEM_PATTERN = re.compile(r"\[Lvl (\d+)\] (.+)")
+
+
+def project_auction(auction):
+    projected = {field: auction[field] for field in AUCTION_FIELDS if field in auction}
+    projected["tier_boost"] = TIER_BOOST_MARKER in auction.get("item_lore", "")
+    return projected
+
+
+def project_object(obj):
+    # object_hook sees every object; only auctions carry a starting_bid
+    if "starting_bid" in obj:
+        return project_auction(obj)
+    return obj
+
+
+def decode_json(body):
+    return json.loads(body, object_hook=project_object)
+
+
+def decode_orjson(body):
+    data = orjson.loads(body)
+    if isinstance(data.get("auctions"), list):
+        data["auctions"] = [project_auction(auction) for auction in data["auctions"]]
+    return data
+
+
+if msgspec is not None:
+
+    class Auction(msgspec.Struct):
+        starting_bid: int
+        uuid: str = "N/A"
+        bin: bool = False
+        tier: str = ""
+        item_name: str = ""
+        start: int | None = None
+        end: int | None = None
+        item_lore: str = ""
+
+    class AuctionPage(msgspec.Struct):
+        success: bool = False
+        page: int | None = None
+        totalPages: int | None = None
+        lastUpdated: int | None = None
+        auctions: list[Auction] | None = None
+        cause: str | None = None
+
+    page_decoder = msgspec.json.Decoder(AuctionPage)
+
+    def decode_msgspec(body):
+        page = page_decoder.decode(body)
+        data = {
+            field: getattr(page, field)
+            for field in ("success", "page", "totalPages", "lastUpdated", "cause")
+            if getattr(page, field) is not None
+        }
+        if page.auctions is not None:
+            data["auctions"] = [
+                {
+                    "uuid": auction.uuid,
+                    "bin": auction.bin,
+                    "tier": auction.tier,
+                    "item_name": auction.item_name,
+                    "starting_bid": auction.starting_bid,
+                    "start": auction.start,
+                    "end": auction.end,
+                    "tier_boost": TIER_BOOST_MARKER in auction.item_lore,
+                }
+                for auction in page.auctions
+            ]
+        return data
+
+else:
+    decode_msgspec = None
+
+DECODERS = {
+    "msgspec": decode_msgspec,
+    "orjson": decode_orjson if orjson is not None else None,
+    "json": decode_json,
+    "full": json.loads,
+}
+
+
+def available_decoders():
+    return [name for name, decode in DECODERS.items() if decode is not None]
+
+
+def get_decoder(name="auto"):
+    """Return ``(name, decode)`` for a decoder name or ``auto``.
+
+    Raises ValueError if the decoder is unknown or its library isn't installed.
+    """
+    if name == "auto":
+        name = available_decoders()[0]
+    if DECODERS.get(name) is None:
+        raise ValueError(
+            f"Unknown or unavailable page decoder {name!r}; "
+            f"available: {', '.join(available_decoders())}"
+        )
+    return name, DECODERS[name]
+
+
+def is_tier_boosted(auction):
+    """Whether an auction is Tier Boosted, given a projected or raw auction."""
+    boosted = auction.get("tier_boost")
+    if boosted is None:
+        return TIER_BOOST_MARKER in auction.get("item_lore", "")
+    return boosted
+
+
+def parse_pet_auction(auction, tracked_pets):
+    """Return the (tier, pet, level) key of a tracked pet BIN, or None.
+
+    Tier Boosted pets are skipped since they don't sell at the base tier's
+    price. The boost is only checked for listings that pass the cheaper tests.
+    """
+    if not auction.get("bin"):
+        return None
+    match = PET_ITEM_PATTERN.fullmatch(auction.get("item_name", ""))
+    if match is None or match.group(2) not in tracked_pets:
+        return None
+    if is_tier_boosted(auction):
+        return None
+    return auction.get("tier"), match.group(2), int(match.group(1))
+
+
+def reduce_auction_page(auctions, tracked_pets, min_auctions):
+    """Fold one page into the running per-(tier, pet, level) minimum.
+
+    Every level is tracked, not just the ones we currently price, and only
+    the cheapest listing per key is kept, stripped down to the fields we
+    store.
+    """
+    for auction in auctions:
+        key = parse_pet_auction(auction, tracked_pets)
+        if key is None:
+            continue
+
+        price = auction["starting_bid"]
+        current = min_auctions.get(key)
+        if current is None or price < current["starting_bid"]:
+            min_auctions[key] = {
+                "starting_bid": price,
+                "uuid": auction.get("uuid", "N/A"),
+            }
+
+
+def page_minimums(auctions, tracked_pets):
+    """Per-(tier, pet, level) minimums of a single page."""
+    min_auctions = {}
+    reduce_auction_page(auctions, tracked_pets, min_auctions)
+    return min_auctions
+
+
+def merge_minimums(partial, min_auctions):
+    """Fold the minimums of one page into the running ones."""
+    for key, entry in partial.items():
+        current = min_auctions.get(key)
+        if current is None or entry["starting_bid"] < current["starting_bid"]:
+            min_auctions[key] = entry
+
+
+def page_pet_auctions(auctions, tracked_pets):
+    """The tracked pet BINs of a page; everything else is dropped."""
+    return [auction for auction in auctions if parse_pet_auction(auction, tracked_pets)]
+
+
+def parse_page(body, decoder="auto", reducer=None):
+    """Decode a page and reduce its auctions with ``reducer(auctions)``.
+
+    This is what runs in the parse pool, so everything it gets and returns
+    must pickle and only the reduced result travels back. The page count is
+    kept in ``auction_count`` and the time spent in ``decode_seconds`` and
+    ``reduce_seconds``. Raises ValueError on a body that isn't an auctions page.
+    """
+    started = time.perf_counter()
+    data = get_decoder(decoder)[1](body)
+    decoded = time.perf_counter()
+    if "auctions" not in data:
+        raise ValueError("Invalid API response: 'auctions' missing")
+    data["auction_count"] = len(data["auctions"])
+    if reducer is not None:
+        data["auctions"] = reducer(data["auctions"])
+    data["decode_seconds"] = decoded - started
+    data["reduce_seconds"] = time.perf_counter() - decoded
+    return data
@@ -0,0 +1,115 @@
+"""Measure SQLite insert and read latency while /analyze traffic runs.
+
+Seeds a throwaway database with history, then runs one writer thread doing
+cycle-sized batch inserts alongside several threads hammering /analyze
+through the Flask test client.
+
+    python benchmarks/db_latency.py --days 7 --readers 8 --seconds 20
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def cycle_rows(app, pet_list, timestamp):
+    rows = []
+    for category in pet_list:
+        for pets in category.values():
+            for pet in pets:
+                for tier in app.RARITY_COLORS:
+                    for level in ("low", "high"):
+                        price = random.randint(10_000, 100_000_000)
+                        rows.append((pet, tier, level, price, timestamp, os.urandom(16).hex()))
+    return rows
+
+
+def seed_history(app, pet_list, days):
+    now = datetime.now()
+    cycles = days * 24 * 12
+    for i in range(cycles, 0, -1):
+        timestamp = now - timedelta(minutes=5 * i)
+        app.write_pet_prices(cycle_rows(app, pet_list, timestamp), timestamp)
+
+
+def summarize(name, samples):
+    print(
+        f"{name:>8}: n={len(samples):<6} "
+        f"p50={percentile(samples, 50) * 1000:8.2f}ms "
+        f"p95={percentile(samples, 95) * 1000:8.2f}ms "
+        f"p99={percentile(samples, 99) * 1000:8.2f}ms "
+        f"mean={statistics.fmean(samples) * 1000 if samples else 0:8.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--days", type=int, default=1, help="days of history to seed")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent /analyze clients")
+    parser.add_argument("--seconds", type=float, default=10, help="benchmark duration")
+    parser.add_argument("--write-interval", type=float, default=0.5, help="seconds between batches")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="petcalc-bench-")
+    for name in ("petlist.json", "GoldenDragon.json", "PetLevels.json"):
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    os.chdir(workdir)
+
+    import app
+
+    app.init_db()
+    pet_list = app.load_pet_list("petlist.json")
+    print(f"Seeding {args.days} day(s) of history in {workdir}")
+    seed_history(app, pet_list, args.days)
+
+    stop = threading.Event()
+    write_samples, read_samples = [], []
+
+    def writer():
+        while not stop.is_set():
+            timestamp = datetime.now()
+            rows = cycle_rows(app, pet_list, timestamp)
+            started = time.perf_counter()
+            app.write_pet_prices(rows, timestamp)
+            write_samples.append(time.perf_counter() - started)
+            stop.wait(args.write_interval)
+
+    def reader():
+        client = app.app.test_client()
+        while not stop.is_set():
+            started = time.perf_counter()
+            client.post("/analyze", data={"skill": random.choice(["Mining", "Combat", "Fishing"])})
+            read_samples.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=writer)]
+    threads += [threading.Thread(target=reader) for _ in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(args.seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    summarize("insert", write_samples)
+    summarize("analyze", read_samples)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Compare /analyze throughput of the Flask (WSGI) and async serving modes.
+
+Seeds a throwaway database, starts each server in a subprocess with
+ingestion disabled, and drives it with many concurrent aiohttp clients.
+
+    python benchmarks/serving_throughput.py --clients 200 --seconds 15
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WSGI_SERVER = """
+import sys
+sys.path.insert(0, {root!r})
+import app
+app.initialize_app()
+app.app.run(host="127.0.0.1", port={port}, threaded=True)
+"""
+
+
+def seed_database(workdir):
+    os.environ["PETCALC_SERVER"] = "async"  # don't start a scheduler in this process
+    import app
+
+    app.init_db()
+    reference = app.get_reference_data()
+    now = datetime.now()
+    rows = [
+        (pet, tier, level, random.randint(10_000, 100_000_000), now, os.urandom(16).hex())
+        for pet in reference["pet_skills"]
+        for tier in app.RARITY_COLORS
+        for level in ("low", "high")
+    ]
+    app.write_pet_prices(rows, now)
+
+
+async def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            try:
+                async with session.get(url) as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up")
+
+
+async def drive(url, clients, seconds):
+    latencies, errors = [], 0
+    deadline = time.monotonic() + seconds
+    connector = aiohttp.TCPConnector(limit=clients)
+
+    async with aiohttp.ClientSession(connector=connector) as session:
+
+        async def client():
+            nonlocal errors
+            while time.monotonic() < deadline:
+                skill = random.choice(["Mining", "Combat", "Fishing", "Farming"])
+                started = time.perf_counter()
+                try:
+                    async with session.get(url, params={"skill": skill}) as response:
+                        await response.read()
+                        if response.status != 200:
+                            errors += 1
+                except aiohttp.ClientError:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*(client() for _ in range(clients)))
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "rps": len(latencies) / seconds,
+        "p50": latencies[len(latencies) // 2] * 1000 if latencies else 0,
+        "p99": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0,
+        "errors": errors,
+    }
+
+
+def run_server(command, workdir, port, clients, seconds):
+    process = subprocess.Popen(
+        command, cwd=workdir, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        base = f"http://127.0.0.1:{port}"
+        asyncio.run(wait_until_up(f"{base}/test_timer"))
+        return asyncio.run(drive(f"{base}/analyze", clients, seconds))
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="petcalc-bench-")
+    for name in ("petlist.json", "GoldenDragon.json", "PetLevels.json"):
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    os.chdir(workdir)
+    seed_database(workdir)
+
+    modes = {
+        "wsgi": [sys.executable, "-c", WSGI_SERVER.format(root=ROOT, port=8781)],
+        "async": [
+            sys.executable,
+            os.path.join(ROOT, "async_server.py"),
+            "--host=127.0.0.1",
+            "--port=8782",
+            "--no-ingest",
+        ],
+    }
+    ports = {"wsgi": 8781, "async": 8782}
+    for mode, command in modes.items():
+        result = run_server(command, workdir, ports[mode], args.clients, args.seconds)
+        print(
+            f"{mode:>6}: {result['requests']} requests, {result['rps']:.0f} req/s, "
+            f"p50={result['p50']:.1f}ms p99={result['p99']:.1f}ms errors={result['errors']}"
+        )
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""Record, synthesize and replay auction snapshots for offline runs.
+
+A snapshot file is gzipped JSON lines: one ``{"page": n, "data": {...}}``
+line per auctions page, plus an optional ``{"ended": {...}}`` line with the
+auctions_ended feed. ``serve`` replays a snapshot on the same paths as
+api.hypixel.net, so pointing ``app.API_URL``/``app.ENDED_API_URL`` at it
+runs ``fetch_auctions`` without network access.
+
+    python benchmarks/snapshots.py record snapshots/live.jsonl.gz
+    python benchmarks/snapshots.py synthesize snapshots/synthetic.jsonl.gz --pages 60
+    python benchmarks/snapshots.py serve snapshots/live.jsonl.gz --port 8765
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+import aiohttp
+from aiohttp import web
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AUCTIONS_URL = "https://api.hypixel.net/v2/skyblock/auctions"
+ENDED_URL = "https://api.hypixel.net/v2/skyblock/auctions_ended"
+AUCTIONS_PATH = "/v2/skyblock/auctions"
+ENDED_PATH = "/v2/skyblock/auctions_ended"
+TIERS = ["COMMON", "UNCOMMON", "RARE", "EPIC", "LEGENDARY", "MYTHIC"]
+
+
+def write_snapshot(path, pages, ended=None):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        for page in pages:
+            f.write(json.dumps({"page": page["page"], "data": page}) + "\n")
+        if ended is not None:
+            f.write(json.dumps({"ended": ended}) + "\n")
+
+
+def load_snapshot(path):
+    """Return ``(pages, ended)`` of a snapshot file, pages ordered by number."""
+    pages, ended = {}, None
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if "ended" in record:
+                ended = record["ended"]
+            else:
+                pages[record["page"]] = record["data"]
+    return [pages[page] for page in sorted(pages)], ended
+
+
+async def record_snapshot(concurrency=16):
+    """Download every page of one consistent snapshot plus the ended feed."""
+    timeout = aiohttp.ClientTimeout(total=30)
+    async with aiohttp.ClientSession(timeout=timeout) as session:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def get(url):
+            async with semaphore:
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    return await response.json()
+
+        while True:
+            first = await get(f"{AUCTIONS_URL}?page=0")
+            rest = await asyncio.gather(
+                *(get(f"{AUCTIONS_URL}?page={page}") for page in range(1, first["totalPages"]))
+            )
+            pages = [first, *rest]
+            if all(page["lastUpdated"] == first["lastUpdated"] for page in pages):
+                break
+            print("Snapshot changed while recording, retrying")
+        ended = await get(ENDED_URL)
+    return pages, ended
+
+
+def synthesize_snapshot(pages=60, per_page=1000, pet_share=0.1, seed=0, last_updated=None):
+    """Build a snapshot shaped like the live API from petlist.json.
+
+    About ``pet_share`` of listings are pets, spread over every tracked pet,
+    tier and level; the rest are filler items with lore and item bytes of a
+    realistic size.
+    """
+    rnd = random.Random(seed)
+    with open(os.path.join(ROOT, "petlist.json")) as f:
+        pet_list = json.load(f)
+    pets = [pet for category in pet_list for names in category.values() for pet in names]
+    last_updated = last_updated or int(time.time() * 1000)
+    filler_lore = "§7A perfectly ordinary item.\n" * 20
+    filler_bytes = "H4sIAAAAAAAAA" + "x" * 400
+
+    snapshot = []
+    for page in range(pages):
+        auctions = []
+        for _ in range(per_page):
+            auction = {
+                "uuid": uuid.UUID(int=rnd.getrandbits(128)).hex,
+                "auctioneer": uuid.UUID(int=rnd.getrandbits(128)).hex,
+                "start": last_updated - rnd.randint(0, 86_400_000),
+                "end": last_updated + rnd.randint(60_000, 1_209_600_000),
+                "bin": rnd.random() < 0.85,
+                "tier": rnd.choice(TIERS),
+                "item_lore": filler_lore,
+                "item_bytes": filler_bytes,
+                "bids": [],
+            }
+            if rnd.random() < pet_share:
+                pet = rnd.choice(pets)
+                low, high = (102, 200) if pet == "Golden Dragon" else (1, 100)
+                level = rnd.choice([low, high, rnd.randint(low, high)])
+                auction["item_name"] = f"[Lvl {level}] {pet}"
+                auction["starting_bid"] = rnd.randint(10_000, 200_000_000)
+                if rnd.random() < 0.03:
+                    auction["item_lore"] += "§8Tier Boost"
+            else:
+                auction["item_name"] = f"Filler Item {rnd.randint(1, 5000)}"
+                auction["starting_bid"] = rnd.randint(100, 10_000_000)
+            auctions.append(auction)
+        snapshot.append(
+            {
+                "success": True,
+                "page": page,
+                "totalPages": pages,
+                "totalAuctions": pages * per_page,
+                "lastUpdated": last_updated,
+                "auctions": auctions,
+            }
+        )
+    return snapshot
+
+
+def create_replay_app(pages, ended=None):
+    """aiohttp app serving ``pages`` (and ``ended``) like the live API."""
+    bodies = [json.dumps(page).encode() for page in pages]
+    ended_body = json.dumps(ended or {"success": True, "auctions": []}).encode()
+
+    async def auctions(request):
+        try:
+            page = int(request.query.get("page", 0))
+        except ValueError:
+            page = -1
+        if not 0 <= page < len(bodies):
+            return web.json_response({"success": False, "cause": "Page not found"}, status=404)
+        return web.Response(body=bodies[page], content_type="application/json")
+
+    async def auctions_ended(request):
+        return web.Response(body=ended_body, content_type="application/json")
+
+    replay_app = web.Application()
+    replay_app.router.add_get(AUCTIONS_PATH, auctions)
+    replay_app.router.add_get(ENDED_PATH, auctions_ended)
+    return replay_app
+
+
+def start_replay_server(pages, ended=None, host="127.0.0.1", port=8765):
+    """Serve a snapshot from a daemon thread; returns the base URL."""
+    started = threading.Event()
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(create_replay_app(pages, ended))
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, host, port).start())
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True, name="replay").start()
+    started.wait()
+    return f"http://{host}:{port}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record = commands.add_parser("record", help="save the live snapshot")
+    record.add_argument("path")
+
+    synthesize = commands.add_parser("synthesize", help="write a synthetic snapshot")
+    synthesize.add_argument("path")
+    synthesize.add_argument("--pages", type=int, default=60)
+    synthesize.add_argument("--per-page", type=int, default=1000)
+    synthesize.add_argument("--seed", type=int, default=0)
+
+    serve = commands.add_parser("serve", help="replay a snapshot over HTTP")
+    serve.add_argument("path")
+    serve.add_argument("--host", default="127.0.0.1")
+    serve.add_argument("--port", type=int, default=8765)
+
+    args = parser.parse_args()
+    if args.command == "record":
+        pages, ended = asyncio.run(record_snapshot())
+        write_snapshot(args.path, pages, ended)
+        print(f"Recorded {len(pages)} pages ({sum(len(p['auctions']) for p in pages)} auctions)")
+    elif args.command == "synthesize":
+        write_snapshot(
+            args.path,
+            synthesize_snapshot(args.pages, args.per_page, seed=args.seed),
+        )
+        print(f"Wrote {args.pages} synthetic pages to {args.path}")
+    else:
+        pages, ended = load_snapshot(args.path)
+        print(f"Replaying {len(pages)} pages on http://{args.host}:{args.port}{AUCTIONS_PATH}")
+        web.run_app(create_replay_app(pages, ended), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,741 @@
+"""Benchmark suite over a replayed auction snapshot and synthetic history.
+
+Measures, each section in a fresh process:
+
+- cycle: end-to-end ``update_pet_prices`` time against a replay server, its
+  per-stage breakdown and the process' peak RSS
+- extract: ``reduce_auction_page`` and ``find_min_auction`` throughput, and
+  per-page time, peak traced memory and retained allocations of every
+  installed page decoder (``full`` is the old ``json.loads`` path)
+- history: ``/analyze`` (cold and cached) and ``/search`` latency with 1 day
+  up to 1 year of synthetic history, laid out the way compaction keeps it
+- summary check: not a timing; fails the run if the running day/week sums
+  drift from a rebuild over 9 days of jittered, compacted cycles
+- snipe, leader takeover, rank paths and parse worker checks: not timings
+  either; against the replay server they check which crafted listings are
+  alerted as snipes (discount, listing age, Tier Boost), that a follower
+  takes over after the leader is SIGKILLed, that numpy and pure-Python
+  /rank results match and that a cycle recovers from killed parse workers
+
+Results are appended to benchmarks/results.jsonl and compared with the last
+run of the same configuration; the exit status is 1 if any metric regressed
+by more than --threshold.
+
+    python benchmarks/suite.py
+    python benchmarks/suite.py --snapshot snapshots/live.jsonl.gz --history-days 1,7,30,365
+    python benchmarks/suite.py --quick --no-save
+    python benchmarks/suite.py --checks-only
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import random
+import resource
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import snapshots  # noqa: E402
+
+RESULTS_PATH = os.path.join(ROOT, "benchmarks", "results.jsonl")
+REPLAY_PORT = 8795
+SKILLS = ["Mining", "Combat", "Fishing", "Farming"]
+# Timings below these floors are mostly noise and never count as regressions
+NOISE_FLOOR = {"_seconds": 0.01, "_ms": 5.0}
+
+
+def make_workdir():
+    workdir = tempfile.mkdtemp(prefix="petcalc-suite-")
+    for name in ("petlist.json", "GoldenDragon.json", "PetLevels.json"):
+        shutil.copy(os.path.join(ROOT, name), workdir)
+    return workdir
+
+
+def import_app(workdir):
+    os.chdir(workdir)
+    os.environ["PETCALC_SERVER"] = "async"  # no module-level scheduler
+    import app
+
+    app.init_db()
+    return app
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def latency_summary(prefix, samples):
+    samples = sorted(samples)
+    return {
+        f"{prefix}_p50_ms": samples[len(samples) // 2] * 1000,
+        f"{prefix}_p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+    }
+
+
+def use_replay(app, base_url):
+    app.API_URL = base_url + snapshots.AUCTIONS_PATH
+    app.ENDED_API_URL = base_url + snapshots.ENDED_PATH
+
+
+def run_cycle(app):
+    if not app.update_pet_prices():
+        raise RuntimeError("update_pet_prices failed against the replay server")
+
+
+def bench_cycle(workdir, base_url, cycles):
+    app = import_app(workdir)
+    use_replay(app, base_url)
+
+    durations = []
+    for _ in range(cycles):
+        started = time.perf_counter()
+        run_cycle(app)
+        durations.append(time.perf_counter() - started)
+    app.shutdown_parse_pool()
+
+    results = {
+        "cycle_seconds": sorted(durations)[len(durations) // 2],
+        "cycle_peak_rss_mb": peak_rss_mb(),
+    }
+    for (name, labels), histogram in app.metric_histograms.items():
+        if name == "petcalc_ingest_stage_seconds":
+            stage = dict(labels)["stage"]
+            results[f"stage_{stage}_seconds"] = histogram["sum"] / histogram["count"]
+    return results
+
+
+def measure_decoder(decode, bodies):
+    """Return (ms per page, peak KiB per page, blocks kept per page) of a decoder."""
+    started = time.perf_counter()
+    for body in bodies:
+        decode(body)
+    seconds = time.perf_counter() - started
+
+    peaks, kept = [], []
+    for body in bodies:
+        gc.collect()
+        blocks = sys.getallocatedblocks()
+        tracemalloc.start()
+        page = decode(body)
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        kept.append(sys.getallocatedblocks() - blocks)
+        del page
+    return (
+        seconds / len(bodies) * 1000,
+        sum(peaks) / len(peaks) / 1024,
+        sum(kept) / len(kept),
+    )
+
+
+def bench_extract(workdir, snapshot_path):
+    app = import_app(workdir)
+    pages, _ = snapshots.load_snapshot(snapshot_path)
+    bodies = [json.dumps(page).encode() for page in pages]
+    auction_count = sum(len(page["auctions"]) for page in pages)
+    tracked_pets = app.get_reference_data()["tracked_pets"]
+
+    results = {}
+    for name in app.auction_decoder.available_decoders():
+        _, decode = app.auction_decoder.get_decoder(name)
+        ms, peak_kib, blocks = measure_decoder(decode, bodies)
+        results[f"decode_{name}_ms_per_page"] = ms
+        results[f"decode_{name}_peak_kib_per_page"] = peak_kib
+        results[f"decode_{name}_kept_blocks_per_page"] = blocks
+    pages = [app.decode_page(body) for body in bodies]
+
+    started = time.perf_counter()
+    min_auctions = {}
+    for page in pages:
+        app.auction_decoder.reduce_auction_page(page["auctions"], tracked_pets, min_auctions)
+    reduce_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for page in pages:
+        app.find_min_auction(page["auctions"])
+    find_min_seconds = time.perf_counter() - started
+
+    results.update(
+        {
+            "reduce_auctions_per_s": auction_count / reduce_seconds,
+            "find_min_auctions_per_s": auction_count / find_min_seconds,
+        }
+    )
+    return results
+
+
+def seed_history(app, days, seed=0):
+    """Fill the database with ``days`` of history as compaction would leave it.
+
+    The newest RAW_RETENTION_DAYS are raw 5-minute rows, then hourly buckets
+    up to HOURLY_RETENTION_DAYS, then daily buckets. Like on the auction
+    house, each series' cheapest listing stays up for about two hours.
+    """
+    rnd = random.Random(seed)
+    reference = app.get_reference_data()
+    series = [
+        (pet, tier, level, rnd.randint(100_000, 100_000_000))
+        for pet in reference["pet_skills"]
+        for tier in app.RARITY_COLORS
+        for level in ("low", "high")
+    ]
+    now = datetime.now()
+    raw_days = min(days, app.RAW_RETENTION_DAYS)
+    hourly_days = min(days, app.HOURLY_RETENTION_DAYS)
+
+    def bucket(pet, tier, level, base, bucket_time, count):
+        prices = [int(base * rnd.uniform(0.9, 1.1)) for _ in range(3)]
+        return (
+            pet, tier, level, bucket_time, prices[0], max(prices), min(prices), prices[-1],
+            sum(prices) * count // 3, count,
+        )
+
+    listings = {}
+    open_intervals = {}
+    with app.db_writer() as conn:
+        for cycle in range(raw_days * 24 * 12, 0, -1):
+            timestamp = now - timedelta(minutes=5 * cycle)
+            rows = []
+            for pet, tier, level, base in series:
+                key = (pet, tier, level)
+                if key not in listings or rnd.random() < 1 / 24:
+                    listings[key] = (int(base * rnd.uniform(0.9, 1.1)), f"seed-{cycle}-{len(rows)}")
+                price, uuid = listings[key]
+                rows.append((pet, tier, level, price, timestamp, uuid))
+            if app.HISTORY_BACKEND == "columnar":
+                app.history_store.append_rows(rows)
+            elif app.HISTORY_BACKEND == "intervals":
+                for row in rows:
+                    closed, open_intervals[row[:3]] = app.fold_listing_rows(
+                        [row], open_intervals.get(row[:3])
+                    )
+                    app.insert_listing_intervals(conn, closed)
+            else:
+                conn.executemany("INSERT INTO pet_prices VALUES (?, ?, ?, ?, ?, ?)", rows)
+        app.insert_listing_intervals(conn, list(open_intervals.values()))
+        for hour in range(raw_days * 24, hourly_days * 24):
+            bucket_time = (now - timedelta(hours=hour)).strftime("%Y-%m-%d %H:00:00")
+            conn.executemany(
+                "INSERT OR IGNORE INTO pet_prices_hourly VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [bucket(*entry, bucket_time, 12) for entry in series],
+            )
+        for day in range(hourly_days, days):
+            bucket_time = (now - timedelta(days=day)).strftime("%Y-%m-%d 00:00:00")
+            conn.executemany(
+                "INSERT OR IGNORE INTO pet_prices_daily VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [bucket(*entry, bucket_time, 288) for entry in series],
+            )
+        app.rebuild_price_summary(conn, now)
+    app.last_update_time = now
+
+
+def bench_history(workdir, days, requests_per_endpoint):
+    app = import_app(workdir)
+    started = time.perf_counter()
+    seed_history(app, days)
+    seed_seconds = time.perf_counter() - started
+
+    client = app.app.test_client()
+    pet_names = sorted(app.get_reference_data()["pet_skills"])
+    rnd = random.Random(1)
+
+    def timed(request):
+        started = time.perf_counter()
+        response = request()
+        if response.status_code != 200:
+            raise RuntimeError(f"HTTP {response.status_code}")
+        return time.perf_counter() - started
+
+    cold, warm, search = [], [], []
+    for _ in range(requests_per_endpoint):
+        skill = rnd.choice(SKILLS)
+        app.ingestion_generation += 1
+        cold.append(timed(lambda: client.get("/analyze", query_string={"skill": skill})))
+        warm.append(timed(lambda: client.get("/analyze", query_string={"skill": skill})))
+        term = rnd.choice(pet_names)[: rnd.randint(2, 6)]
+        search.append(timed(lambda: client.post("/search", data={"search_term": term})))
+
+    db_size = app.history_store.disk_usage() + sum(
+        os.path.getsize(path)
+        for path in (app.DB_PATH, f"{app.DB_PATH}-wal")
+        if os.path.exists(path)
+    )
+    suffix = f"@{days}d"
+    results = {f"seed_seconds{suffix}": seed_seconds, f"db_size_mb{suffix}": db_size / 1e6}
+    for prefix, samples in (("analyze_cold", cold), ("analyze_cached", warm), ("search", search)):
+        results.update(
+            {f"{key}{suffix}": value for key, value in latency_summary(prefix, samples).items()}
+        )
+    return results
+
+
+def check_summary(workdir, days=9, series_count=20, seed=0):
+    """Compare the running summary with a rebuild after compacted cycles.
+
+    Runs ``days`` of 5-minute cycles with a few seconds of fetch jitter and
+    hourly compaction, then rebuilds pet_price_summary from the remaining
+    history. Raises if any series' day/week sums or counts drifted.
+    """
+    app = import_app(workdir)
+    rnd = random.Random(seed)
+    reference = app.get_reference_data()
+    series = [
+        (pet, tier, level)
+        for pet in sorted(reference["pet_skills"])
+        for tier in app.RARITY_COLORS
+        for level in ("low", "high")
+    ][:series_count]
+    # Compaction runs a minute past the hour, between two cycles, like two
+    # independent scheduler jobs would
+    start = (datetime.now() - timedelta(days=days)).replace(minute=0, second=0, microsecond=0)
+    next_compaction = start + timedelta(hours=1, minutes=1)
+    listings = {}
+    for cycle in range(days * 24 * 12):
+        timestamp = start + timedelta(minutes=5 * cycle + 3, seconds=rnd.randint(0, 20))
+        if timestamp >= next_compaction:
+            app.compact_history(next_compaction)
+            next_compaction += timedelta(hours=1)
+        rows = []
+        for key in series:
+            if key not in listings or rnd.random() < 1 / 24:
+                listings[key] = (rnd.randint(100_000, 100_000_000), f"check-{cycle}-{len(rows)}")
+            price, uuid = listings[key]
+            rows.append((*key, price, timestamp, uuid))
+        app.write_pet_prices(rows, timestamp)
+
+    query = """
+    SELECT pet_name, rarity, level, price, day_sum, day_count, week_sum, week_count
+    FROM pet_price_summary ORDER BY pet_name, rarity, level
+    """
+    with app.db_reader() as conn:
+        running = conn.execute(query).fetchall()
+    with app.db_writer() as conn:
+        app.rebuild_price_summary(conn, timestamp)
+    with app.db_reader() as conn:
+        rebuilt = conn.execute(query).fetchall()
+    drifted = [(before, after) for before, after in zip(running, rebuilt) if before != after]
+    if len(running) != len(rebuilt) or drifted:
+        raise RuntimeError(
+            f"{len(drifted)} of {len(rebuilt)} summary rows differ from a rebuild, "
+            f"e.g. {drifted[:1]}"
+        )
+    return {}
+
+
+def check_snipes(workdir, base_url, snapshot_path):
+    """Replay a page 0 with crafted listings and check which are alerted.
+
+    Of four listings of one profitable low-level series only the fresh one
+    at half its day average may be alerted: one above SNIPE_PRICE_RATIO,
+    one listed before SNIPE_MAX_LISTING_AGE_SECONDS and a Tier Boosted one
+    must not be. Polling the same page again must not repeat the alert.
+    """
+    app = import_app(workdir)
+    use_replay(app, base_url)
+    run_cycle(app)
+    app.poll_snipes()  # everything already listed counts as seen
+
+    candidates = [
+        (key, entry)
+        for key, entry in sorted(app.snipe_index.items())
+        if entry["level"] == "low"
+        and app.price_snipe(key, {"starting_bid": int(entry["day_avg"] / 2)}, entry)["profit"] > 0
+    ]
+    if not candidates:
+        raise RuntimeError("the snapshot has no series a half-price listing would profit on")
+    (tier, pet, level), entry = candidates[0]
+
+    now_ms = int(time.time() * 1000)
+    listing = {"bin": True, "tier": tier, "item_name": f"[Lvl {level}] {pet}", "item_lore": ""}
+    half_price = int(entry["day_avg"] / 2)
+    crafted = [
+        {**listing, "uuid": "snipe-fresh", "starting_bid": half_price, "start": now_ms - 3000},
+        {
+            **listing,
+            "uuid": "snipe-pricey",
+            "starting_bid": int(entry["day_avg"] * 0.9),
+            "start": now_ms,
+        },
+        {
+            **listing,
+            "uuid": "snipe-stale",
+            "starting_bid": half_price,
+            "start": now_ms - (app.SNIPE_MAX_LISTING_AGE_SECONDS + 60) * 1000,
+        },
+        {
+            **listing,
+            "uuid": "snipe-boosted",
+            "starting_bid": half_price,
+            "start": now_ms,
+            "item_lore": "§8Tier Boost",
+        },
+    ]
+    pages, ended = snapshots.load_snapshot(snapshot_path)
+    pages[0] = {
+        **pages[0],
+        "lastUpdated": pages[0]["lastUpdated"] + 1,
+        "auctions": crafted + pages[0]["auctions"],
+    }
+    use_replay(app, snapshots.start_replay_server(pages, ended, port=REPLAY_PORT + 1))
+
+    events = []
+    app.subscribe_events(app.DEFAULT_SKILL, events.append)
+    polled_at = time.time()
+    app.poll_snipes()
+    app.poll_snipes()
+    alerted = [snipe["uuid"] for snipe in app.recent_snipes if snipe["detected_at"] >= polled_at]
+    snipe_events = [event for event in events if event.startswith("event: snipe\n")]
+    if alerted != ["snipe-fresh"]:
+        raise RuntimeError(f"expected only snipe-fresh to be alerted, got {alerted}")
+    if len(snipe_events) != 1 or '"uuid":"snipe-fresh"' not in snipe_events[0]:
+        raise RuntimeError(f"expected one snipe event for snipe-fresh, got {snipe_events}")
+    return {}
+
+
+def leader_worker(workdir, base_url, states):
+    """A MULTI_WORKER server process reduced to its shared-state poll job."""
+    os.environ["PETCALC_MULTI_WORKER"] = "1"
+    app = import_app(workdir)
+    use_replay(app, base_url)
+    # Let the next leader serve a refresh right after the last one's cycle
+    app.MIN_REFRESH_INTERVAL_SECONDS = 0
+    while True:
+        app.poll_shared_state()
+        states.put((os.getpid(), app.leader_lock_file is not None, app.last_update_time))
+        time.sleep(app.SHARED_RESULTS_POLL_SECONDS)
+
+
+def check_leader_takeover(workdir, base_url):
+    """SIGKILL the ingestion leader of two workers and check the other takes over.
+
+    The survivor must hold the leader lock within two poll intervals and
+    then run the next requested cycle itself.
+    """
+    app = import_app(workdir)
+    context = multiprocessing.get_context("spawn")
+    states = context.Queue()
+    workers = {}
+    for _ in range(2):
+        process = context.Process(
+            target=leader_worker, args=(workdir, base_url, states), daemon=True
+        )
+        process.start()
+        workers[process.pid] = process
+    latest = {}
+
+    def wait_for(condition, timeout, what):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise RuntimeError(f"timed out waiting for {what}")
+            try:
+                pid, leader, updated = states.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if pid in workers:
+                latest[pid] = (leader, updated)
+
+    def request_cycle():
+        with open(app.REFRESH_REQUEST_PATH, "w") as f:
+            f.write("suite\n")
+
+    try:
+        wait_for(lambda: len(latest) == len(workers), 60, "both workers to start")
+        leaders = [pid for pid, (leader, _) in latest.items() if leader]
+        if len(leaders) != 1:
+            raise RuntimeError(f"expected one leader, got {len(leaders)}")
+        request_cycle()
+        wait_for(
+            lambda: all(updated for _, updated in latest.values()),
+            120,
+            "the leader's cycle to reach both workers",
+        )
+
+        os.kill(leaders[0], signal.SIGKILL)
+        workers.pop(leaders[0]).join()
+        del latest[leaders[0]]
+        (survivor,) = workers
+        before = latest[survivor][1]
+        wait_for(
+            lambda: latest[survivor][0],
+            2 * app.SHARED_RESULTS_POLL_SECONDS,
+            "the surviving worker to take over",
+        )
+        request_cycle()
+        wait_for(lambda: latest[survivor][1] > before, 120, "the new leader's cycle")
+    finally:
+        for process in workers.values():
+            process.kill()
+            process.join()
+    return {}
+
+
+def check_rank_paths(workdir, base_url):
+    """Rank varied parameter sets with numpy and pure Python; results must match."""
+    app = import_app(workdir)
+    if app.np is None:
+        print("  numpy is not installed, only the pure-Python path exists")
+        return {}
+    use_replay(app, base_url)
+    run_cycle(app)
+
+    payload = [
+        {
+            "id": f"{skill}-{xp_boost}-{i}",
+            "skill": skill,
+            "xp_boost": xp_boost,
+            "ah_tax": ah_tax,
+            "budget": budget,
+            "min_profit": min_profit,
+            "top": app.RANK_MAX_TOP,
+        }
+        for skill in SKILLS
+        for xp_boost in (0, 0.2)
+        for i, (ah_tax, budget, min_profit) in enumerate(
+            [
+                (0.01, None, None),
+                ([[10_000_000, 0.01], [100_000_000, 0.02], [None, 0.025]], 50_000_000, None),
+                (0.025, None, 1_000_000),
+            ]
+        )
+    ]
+    sets, error = app.parse_rank_request({"sets": payload})
+    if error is not None:
+        raise RuntimeError(f"/rank rejected the parameter sets: {error[0]}")
+    vectorized = app.rank_parameter_sets(sets)
+    numpy, app.np, app.price_matrix = app.np, None, None
+    try:
+        pure = app.rank_parameter_sets(sets)
+    finally:
+        app.np, app.price_matrix = numpy, None
+
+    for ranked, expected in zip(vectorized["results"], pure["results"]):
+        if ranked != expected:
+            rows = [
+                (got, want)
+                for got, want in zip(ranked["rows"], expected["rows"])
+                if got != want
+            ]
+            raise RuntimeError(
+                f"set {ranked['params']['id']}: numpy and pure-Python rankings differ, "
+                f"{ranked['matches']} vs {expected['matches']} matches, e.g. {rows[:1]}"
+            )
+    return {}
+
+
+def check_parse_worker_recovery(workdir, base_url):
+    """SIGKILL the parse workers between cycles; a fresh pool must take over.
+
+    The cycle that finds the pool broken may fail, the one after it must
+    store the same prices as before the kill.
+    """
+    os.environ["PETCALC_PARSE_WORKERS"] = "2"
+    app = import_app(workdir)
+    use_replay(app, base_url)
+    query = "SELECT pet_name, rarity, level, price FROM pet_price_summary ORDER BY 1, 2, 3"
+    run_cycle(app)
+    with app.db_reader() as conn:
+        before = conn.execute(query).fetchall()
+
+    killed = list(app.parse_pool._processes)
+    for pid in killed:
+        os.kill(pid, signal.SIGKILL)
+    if not app.update_pet_prices():
+        run_cycle(app)
+    if app.parse_pool is None or set(app.parse_pool._processes) & set(killed):
+        raise RuntimeError("the killed parse workers were not replaced")
+    with app.db_reader() as conn:
+        after = conn.execute(query).fetchall()
+    app.shutdown_parse_pool()
+    if after != before:
+        raise RuntimeError("prices after the recovered cycle differ from the first cycle")
+    return {}
+
+
+def section_worker(queue, func, *args):
+    try:
+        queue.put(("ok", func(*args)))
+    except Exception as e:
+        queue.put(("error", f"{type(e).__name__}: {e}"))
+
+
+def run_section(name, func, *args):
+    """Run one section in a fresh process so module state and RSS don't leak."""
+    print(f"Running {name}...", flush=True)
+    workdir = make_workdir()
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=section_worker, args=(queue, func, workdir, *args))
+    process.start()
+    status, payload = queue.get()
+    process.join()
+    shutil.rmtree(workdir, ignore_errors=True)
+    if status != "ok":
+        raise RuntimeError(f"{name} failed: {payload}")
+    return payload
+
+
+def start_replay(snapshot_path):
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT, "benchmarks", "snapshots.py"),
+            "serve",
+            snapshot_path,
+            f"--port={REPLAY_PORT}",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{REPLAY_PORT}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{base_url}{snapshots.ENDED_PATH}", timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Replay server did not come up")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_previous(config):
+    if not os.path.exists(RESULTS_PATH):
+        return None
+    previous = None
+    with open(RESULTS_PATH) as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry["config"] == config:
+                previous = entry
+    return previous
+
+
+def compare(results, previous, threshold):
+    """Print every metric next to the previous run; return the regressed ones."""
+    regressions = []
+    for name, value in sorted(results.items()):
+        before = previous["results"].get(name) if previous else None
+        if not before:
+            print(f"  {name:<36} {value:>12.3f}")
+            continue
+        change = (value - before) / before
+        # Throughputs (*_per_s) regress when they drop, everything else when it grows
+        regressed = -change > threshold if name.endswith("_per_s") else change > threshold
+        metric = name.split("@")[0]
+        for suffix, floor in NOISE_FLOOR.items():
+            if metric.endswith(suffix) and max(value, before) < floor:
+                regressed = False
+        flag = "  REGRESSION" if regressed else ""
+        print(f"  {name:<36} {value:>12.3f} {before:>12.3f} {change:>+8.1%}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--snapshot", help="recorded snapshot; a synthetic one by default")
+    parser.add_argument("--pages", type=int, default=60, help="pages of the synthetic snapshot")
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--history-days", default="1,7,30,365")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--history-backend", choices=["sqlite", "columnar", "intervals"], default="sqlite")
+    parser.add_argument("--parse-workers", type=int, default=0, help="PETCALC_PARSE_WORKERS")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown")
+    parser.add_argument("--quick", action="store_true", help="small run for smoke testing")
+    parser.add_argument("--no-save", action="store_true", help="don't append to results.jsonl")
+    parser.add_argument("--checks-only", action="store_true", help="run the checks, skip timings")
+    args = parser.parse_args()
+    if args.quick:
+        args.pages, args.cycles, args.history_days, args.requests = 10, 1, "1,7", 50
+    history_days = [int(days) for days in args.history_days.split(",")]
+    os.environ["PETCALC_HISTORY_BACKEND"] = args.history_backend
+    os.environ["PETCALC_PARSE_WORKERS"] = str(args.parse_workers)
+
+    snapshot_dir = tempfile.mkdtemp(prefix="petcalc-snapshot-")
+    snapshot_path = args.snapshot
+    if snapshot_path is None:
+        snapshot_path = os.path.join(snapshot_dir, "synthetic.jsonl.gz")
+        snapshots.write_snapshot(snapshot_path, snapshots.synthesize_snapshot(args.pages))
+
+    config = {
+        "snapshot": os.path.basename(args.snapshot) if args.snapshot else f"synthetic-{args.pages}",
+        "cycles": args.cycles,
+        "history_days": history_days,
+        "requests": args.requests,
+        "history_backend": args.history_backend,
+        "parse_workers": args.parse_workers,
+    }
+    results = {}
+    replay, base_url = start_replay(snapshot_path)
+    try:
+        if not args.checks_only:
+            results.update(run_section("cycle", bench_cycle, base_url, args.cycles))
+        run_section("snipe check", check_snipes, base_url, snapshot_path)
+        run_section("leader takeover check", check_leader_takeover, base_url)
+        run_section("rank paths check", check_rank_paths, base_url)
+        run_section("parse worker check", check_parse_worker_recovery, base_url)
+    finally:
+        replay.terminate()
+        replay.wait()
+    run_section("summary check", check_summary)
+    if args.checks_only:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        return
+    results.update(run_section("extract", bench_extract, snapshot_path))
+    for days in history_days:
+        results.update(run_section(f"history {days}d", bench_history, days, args.requests))
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+    previous = load_previous(config)
+    if previous:
+        print(f"Compared with {previous['commit']} from {previous['timestamp']}:")
+    regressions = compare(results, previous, args.threshold)
+
+    if not args.no_save:
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "config": config,
+            "results": results,
+        }
+        with open(RESULTS_PATH, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""Append-only columnar store for raw price history.
+
+Used instead of the pet_prices table when PETCALC_HISTORY_BACKEND=columnar.
+Each local day gets its own directory of column files:
+
+    history/series.jsonl          one [pet_name, rarity, level] per line; line n is series id n
+    history/2026-10-18/time.col   uint32 epoch seconds
+    history/2026-10-18/series.col uint16 series id
+    history/2026-10-18/price.col  int64 price
+
+Rows are appended in time order, so every day's time column is sorted and
+windows are found by bisection. An interrupted append can leave the columns
+of a day at different lengths: readers memory-map the files and use the
+shortest column as the row count, and the next append first truncates every
+column back to that count so later rows stay aligned.
+Scans use numpy when it is installed and plain memoryviews otherwise.
+"""
+import json
+import mmap
+import os
+import shutil
+import threading
+from array import array
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # optional, scans fall back to pure Python
+    np = None
+
+HISTORY_DIR = "history"
+COLUMNS = {"time": "I", "series": "H", "price": "q"}
+NUMPY_TYPES = {"I": "uint32", "H": "uint16", "q": "int64"}
+# Below this many rows a plain loop beats numpy's per-call overhead
+NUMPY_MIN_ROWS = 4096
+
+_series_ids = {}
+_series_keys = []
+_lock = threading.Lock()
+
+
+def series_path():
+    return os.path.join(HISTORY_DIR, "series.jsonl")
+
+
+def day_dir(day):
+    return os.path.join(HISTORY_DIR, day.isoformat())
+
+
+def load_series():
+    """Pick up series added by another process since the last load."""
+    path = series_path()
+    if not os.path.exists(path):
+        return
+    with open(path) as f:
+        for line in f.readlines()[len(_series_keys):]:
+            key = tuple(json.loads(line))
+            _series_ids[key] = len(_series_keys)
+            _series_keys.append(key)
+
+
+def get_series_id(key):
+    """Return the id of a (pet_name, rarity, level) series, assigning one if new."""
+    series_id = _series_ids.get(key)
+    if series_id is not None:
+        return series_id
+    load_series()
+    if key not in _series_ids:
+        with open(series_path(), "a") as f:
+            f.write(json.dumps(list(key)) + "\n")
+        _series_ids[key] = len(_series_keys)
+        _series_keys.append(key)
+    return _series_ids[key]
+
+
+def get_series_key(series_id):
+    if series_id >= len(_series_keys):
+        load_series()
+    return _series_keys[series_id]
+
+
+def align_columns(day):
+    """Truncate the day's column files to the rows all of them have."""
+    paths = {name: os.path.join(day_dir(day), f"{name}.col") for name in COLUMNS}
+    sizes = {
+        name: os.path.getsize(path) if os.path.exists(path) else 0
+        for name, path in paths.items()
+    }
+    rows = min(sizes[name] // array(code).itemsize for name, code in COLUMNS.items())
+    for name, code in COLUMNS.items():
+        if sizes[name] > rows * array(code).itemsize:
+            with open(paths[name], "r+b") as f:
+                f.truncate(rows * array(code).itemsize)
+
+
+def append_rows(rows):
+    """Append (pet, rarity, level, price, timestamp, uuid) rows.
+
+    The uuid isn't stored; the latest one per series lives in
+    pet_price_summary.
+    """
+    with _lock:
+        os.makedirs(HISTORY_DIR, exist_ok=True)
+        by_day = {}
+        for pet, rarity, level, price, timestamp, _ in rows:
+            columns = by_day.get(timestamp.date())
+            if columns is None:
+                columns = {name: array(code) for name, code in COLUMNS.items()}
+                by_day[timestamp.date()] = columns
+            columns["time"].append(int(timestamp.timestamp()))
+            columns["series"].append(get_series_id((pet, rarity, level)))
+            columns["price"].append(price)
+
+        for day, columns in sorted(by_day.items()):
+            os.makedirs(day_dir(day), exist_ok=True)
+            align_columns(day)
+            for name, values in columns.items():
+                with open(os.path.join(day_dir(day), f"{name}.col"), "ab") as f:
+                    f.write(values.tobytes())
+
+
+def stored_days():
+    if not os.path.isdir(HISTORY_DIR):
+        return []
+    days = []
+    for name in os.listdir(HISTORY_DIR):
+        try:
+            days.append(date.fromisoformat(name))
+        except ValueError:
+            continue
+    return sorted(days)
+
+
+def map_day(day):
+    """Return the day's columns as memory-mapped arrays, or None if it has no rows.
+
+    The maps are never closed explicitly; they go away with the last view
+    of them, so slices handed out stay valid.
+    """
+    maps = {}
+    for name in COLUMNS:
+        path = os.path.join(day_dir(day), f"{name}.col")
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            return None
+        with open(path, "rb") as f:
+            maps[name] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    rows = min(len(maps[name]) // array(code).itemsize for name, code in COLUMNS.items())
+    if np is not None:
+        return {
+            name: np.frombuffer(maps[name], dtype=NUMPY_TYPES[code], count=rows)
+            for name, code in COLUMNS.items()
+        }
+    return {
+        name: memoryview(maps[name])[: rows * array(code).itemsize].cast(code)
+        for name, code in COLUMNS.items()
+    }
+
+
+def scan(start, end):
+    """Yield ``(series, price, time)`` column slices for rows with start < time <= end.
+
+    ``start`` may be None for an open lower bound.
+    """
+    start_ts = int(start.timestamp()) if start is not None else -1
+    end_ts = int(end.timestamp())
+    for day in stored_days():
+        if start is not None and day < start.date() or day > end.date():
+            continue
+        columns = map_day(day)
+        if columns is None:
+            continue
+        times = columns["time"]
+        if np is not None:
+            lo, hi = np.searchsorted(times, [start_ts, end_ts], side="right")
+        else:
+            lo, hi = bisect_right(times, start_ts), bisect_right(times, end_ts)
+        if lo < hi:
+            yield columns["series"][lo:hi], columns["price"][lo:hi], times[lo:hi]
+
+
+def window_aggregates(start, end):
+    """Return {(pet_name, rarity, level): (count, sum, min, max)} for start < time <= end."""
+    totals = {}
+    for series, prices, _ in scan(start, end):
+        if np is not None and len(series) >= NUMPY_MIN_ROWS:
+            ids = np.unique(series)
+            counts = np.bincount(series)
+            sums = np.bincount(series, weights=prices)
+            minimums = np.full(len(counts), np.iinfo(np.int64).max)
+            maximums = np.full(len(counts), np.iinfo(np.int64).min)
+            np.minimum.at(minimums, series, prices)
+            np.maximum.at(maximums, series, prices)
+            chunk = {
+                int(i): (int(counts[i]), int(sums[i]), int(minimums[i]), int(maximums[i]))
+                for i in ids
+            }
+        else:
+            chunk = {}
+            for series_id, price in zip(series.tolist(), prices.tolist()):
+                current = chunk.get(series_id)
+                if current is None:
+                    chunk[series_id] = (1, price, price, price)
+                else:
+                    count, total, low, high = current
+                    chunk[series_id] = (
+                        count + 1,
+                        total + price,
+                        low if low < price else price,
+                        high if high > price else price,
+                    )
+        for series_id, (count, total, low, high) in chunk.items():
+            current = totals.get(series_id)
+            if current is not None:
+                count, total = count + current[0], total + current[1]
+                low, high = min(low, current[2]), max(high, current[3])
+            totals[series_id] = (count, total, low, high)
+    return {get_series_key(series_id): value for series_id, value in totals.items()}
+
+
+def series_points(key, start, end):
+    """Return [(epoch_seconds, price)] of one series for start < time <= end."""
+    if key not in _series_ids:
+        load_series()
+    series_id = _series_ids.get(key)
+    if series_id is None:
+        return []
+    points = []
+    for series, prices, times in scan(start, end):
+        if np is not None:
+            mask = series == series_id
+            points.extend(zip(times[mask].tolist(), prices[mask].tolist()))
+        else:
+            points.extend(
+                (ts, price)
+                for sid, price, ts in zip(series.tolist(), prices.tolist(), times.tolist())
+                if sid == series_id
+            )
+    return points
+
+
+def latest_prices():
+    """Return {(pet_name, rarity, level): (price, timestamp)} of each series' newest row."""
+    latest = {}
+    for day in reversed(stored_days()):
+        columns = map_day(day)
+        if columns is None:
+            continue
+        for i in range(len(columns["time"]) - 1, -1, -1):
+            series_id = int(columns["series"][i])
+            if series_id not in latest:
+                latest[series_id] = (
+                    int(columns["price"][i]),
+                    datetime.fromtimestamp(int(columns["time"][i])),
+                )
+        if len(latest) == len(_series_keys):
+            break
+    return {get_series_key(series_id): value for series_id, value in latest.items()}
+
+
+def hourly_buckets(day):
+    """Return OHLC rows for pet_prices_hourly covering one stored day.
+
+    Rows are (pet_name, rarity, level, bucket, open, high, low, close, sum, count).
+    """
+    columns = map_day(day)
+    if columns is None:
+        return []
+    buckets = {}
+    hours = {}
+    for series_id, price, ts in zip(columns["series"], columns["price"], columns["time"]):
+        ts = int(ts)
+        hour = hours.get(ts)
+        if hour is None:
+            hour = datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:00:00")
+            hours[ts] = hour
+        key = (int(series_id), hour)
+        price = int(price)
+        bucket = buckets.get(key)
+        if bucket is None:
+            buckets[key] = [price, price, price, price, price, 1]
+        else:
+            bucket[1] = max(bucket[1], price)
+            bucket[2] = min(bucket[2], price)
+            bucket[3] = price
+            bucket[4] += price
+            bucket[5] += 1
+    return [
+        (*get_series_key(series_id), hour, *bucket)
+        for (series_id, hour), bucket in sorted(buckets.items())
+    ]
+
+
+def clear():
+    with _lock:
+        shutil.rmtree(HISTORY_DIR, ignore_errors=True)
+        _series_ids.clear()
+        _series_keys.clear()
+
+
+def delete_day(day):
+    shutil.rmtree(day_dir(day), ignore_errors=True)
+
+
+def disk_usage():
+    total = 0
+    for root, _, files in os.walk(HISTORY_DIR):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def days_before(cutoff):
+    """Stored days that lie entirely before ``cutoff``."""
+    return [day for day in stored_days() if day + timedelta(days=1) <= cutoff.date()]
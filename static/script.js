@@ -2,6 +2,15 @@ console.log("Script starting");
 
 // Store the results from the server
 let storedResults = [];
+// Whether storedResults holds the /analyze ranking or /search results
+let currentView = 'analyze';
+// Push channel for ranking diffs and the update countdown
+let eventSource = null;
+let nextUpdateAt = null;
+// ETag of the /analyze ranking in storedResults; diffs only apply on top of it
+let resultsEtag = null;
+// Set once the page falls back to polling the timer
+let pollingTimer = false;
 
 // Function to copy UUID to clipboard
 function copyTextToClipboard(text, buttonElement, event) {
@@ -28,7 +37,7 @@ $(document).ready(function() {
     initializeFilters();
     applySettingsFromCookies();
     analyzeAuctions();
-    updateTimer();
+    connectEvents();
 
     // Function to set a cookie
     function setCookie(name, value, days) {
@@ -104,11 +113,13 @@ $(document).ready(function() {
         $('#loading').show();
         $('#results').hide();
         console.log('Sending request to /analyze');
-        $.post('/analyze', {
+        $.get('/analyze', {
             skill: selectedSkill
-        }, function(data) {
+        }, function(data, textStatus, jqXHR) {
             console.log('Received response from /analyze', data);
             storedResults = data;
+            resultsEtag = parseEtag(jqXHR);
+            currentView = 'analyze';
             sortAndDisplayResults();
             $('#loading').hide();
             $('#results').show();
@@ -125,6 +136,7 @@ $(document).ready(function() {
     $('#skillSelect').change(function() {
         setCookie('selectedSkill', $(this).val(), 30);
         analyzeAuctions();
+        connectEvents();
     });
 
     $('#searchButton').click(function() {
@@ -137,6 +149,7 @@ $(document).ready(function() {
             skill: selectedSkill
         }, function(data) {
             storedResults = data;
+            currentView = 'search';
             sortAndDisplayResults();
             $('#loading').hide();
             $('#results').show();
@@ -320,6 +333,97 @@ $(document).ready(function() {
         });
     }
 
+    function parseEtag(jqXHR) {
+        const etag = jqXHR.getResponseHeader('ETag');
+        return etag ? etag.replace(/^W\//, '').replace(/"/g, '') : null;
+    }
+
+    // Quietly reload the ranking, e.g. after missing a diff
+    function refreshRankings() {
+        $.get('/analyze', {
+            skill: $('#skillSelect').val()
+        }, function(data, textStatus, jqXHR) {
+            if (currentView !== 'analyze') return;
+            storedResults = data;
+            resultsEtag = parseEtag(jqXHR);
+            sortAndDisplayResults();
+        });
+    }
+
+    function startPollingTimer() {
+        if (pollingTimer) return;
+        pollingTimer = true;
+        updateTimer();
+    }
+
+    // Subscribe to server-pushed ranking diffs and countdowns for the selected skill.
+    // Browsers without EventSource, or servers that don't stream events, fall
+    // back to polling the timer.
+    function connectEvents() {
+        if (!window.EventSource || pollingTimer) {
+            startPollingTimer();
+            return;
+        }
+        if (eventSource) {
+            eventSource.close();
+        }
+        const selectedSkill = $('#skillSelect').val();
+        const source = new EventSource('/events?skill=' + encodeURIComponent(selectedSkill));
+        eventSource = source;
+        let opened = false;
+
+        source.onopen = function() {
+            // Diffs sent while reconnecting were missed
+            if (opened) refreshRankings();
+            opened = true;
+        };
+
+        source.onerror = function() {
+            // The browser retries dropped streams by itself; a refused one is closed
+            if (source.readyState === EventSource.CLOSED && eventSource === source) {
+                eventSource = null;
+                startPollingTimer();
+            }
+        };
+
+        source.addEventListener('countdown', function(e) {
+            const data = JSON.parse(e.data);
+            if (data.last_update) {
+                $('#lastUpdateTime').text(new Date(data.last_update).toLocaleString());
+            }
+            nextUpdateAt = new Date(data.next_update);
+            tickCountdown();
+        });
+
+        source.addEventListener('rankings', function(e) {
+            applyRankingDiff(JSON.parse(e.data));
+        });
+    }
+
+    // Count down locally between pushes instead of asking the server every second
+    function tickCountdown() {
+        if (!nextUpdateAt) return;
+        const timeLeft = Math.max(0, Math.floor((nextUpdateAt - new Date()) / 1000));
+        $('#nextUpdateTime').text(formatTimeLeft(timeLeft));
+    }
+    setInterval(tickCountdown, 1000);
+
+    function applyRankingDiff(diff) {
+        if (currentView !== 'analyze') return;
+        if (diff.base_etag !== resultsEtag) {
+            // Built on a ranking we don't have; start again from the full one
+            refreshRankings();
+            return;
+        }
+        const rowKey = item => item.name + '|' + item.rarity;
+        const rows = new Map(storedResults.map(item => [rowKey(item), item]));
+        diff.removed.forEach(([name, rarity]) => rows.delete(name + '|' + rarity));
+        diff.changed.forEach(item => rows.set(rowKey(item), item));
+        storedResults = Array.from(rows.values());
+        resultsEtag = diff.etag;
+        sortAndDisplayResults();
+    }
+
     function updateTimer() {
         $.get('/test_timer', function(data) {
             $('#lastUpdateTime').text(new Date(data.last_update).toLocaleString());
@@ -340,16 +444,32 @@ $(document).ready(function() {
     }
 
     function triggerUpdate() {
-        $.post('/trigger_update', function(data) {
-            if (data.success) {
+        $.post('/trigger_update').done(function(data) {
+            // 202: an update is running (possibly started by someone else); wait for it
+            waitForUpdate(data.status_url);
+        }).fail(function(jqXHR, textStatus, errorThrown) {
+            if (jqXHR.status === 429) {
+                // Updated recently, nothing to wait for
+                location.reload();
+                return;
+            }
+            console.error("Error triggering update:", textStatus, errorThrown);
+            setTimeout(triggerUpdate, 5000);
+        });
+    }
+
+    function waitForUpdate(statusUrl) {
+        $.get(statusUrl, function(data) {
+            if (data.status === 'running') {
+                setTimeout(function() { waitForUpdate(statusUrl); }, 2000);
+            } else if (data.status === 'succeeded') {
                 console.log("Update successful, reloading page...");
                 location.reload();
             } else {
                 console.error("Update failed, retrying in 5 seconds...");
                 setTimeout(triggerUpdate, 5000);
             }
-        }).fail(function(jqXHR, textStatus, errorThrown) {
-            console.error("Error triggering update:", textStatus, errorThrown);
+        }).fail(function() {
             setTimeout(triggerUpdate, 5000);
         });
     }